@@ -1,20 +1,26 @@
 import threading
 from src.config import ConfigManager
+from src.broadcast import FrameHub
 
 # Global locks and events
-frame_lock = threading.Lock()
-new_frame_event = threading.Event()
 stop_event = threading.Event()
 
 # Shared data
-latest_jpeg_frame = None
 global_cam_ref = None
 global_gpio_enabled = False
 global_led_pin = 21
+# Relay pin of every camera pipeline that drives one; all are switched off on shutdown
+global_led_pins = []
+pipeline_queues = {}
+stats_providers = {}
 
 # Constants
-CAM_WIDTH = 1280
-CAM_HEIGHT = 720
 MIN_CROP_SIZE = 256
 
-config_mgr = ConfigManager()
\ No newline at end of file
+config_mgr = ConfigManager()
+frame_hub = FrameHub()
+# Per-frame detection metadata (JSON) for client-side overlays
+meta_hub = FrameHub()
+# Per-camera hubs when several cameras are configured; the first camera uses the two above
+frame_hubs = {}
+meta_hubs = {}
\ No newline at end of file
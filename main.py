@@ -1,19 +1,55 @@
 import threading
+from fastapi import WebSocket
+from fastapi.responses import PlainTextResponse
 from nicegui import ui, app
 from src.logger import create_log
 from src.utils import cleanup_resources
 
 import global_state as state
 from src.detection import run_detection_thread
-from src.streaming import get_video_feed_response
+from src.streaming import get_video_feed_response, stream_websocket, stream_metadata_websocket
+from src.pipeline import collect_stats, register_stats
+from src.metrics import render_metrics
 from src.pages.dashboard import create_main_page
 from src.pages.history import create_history_page
 
 logger = create_log()
 
+register_stats("stream", state.frame_hub.stats)
+register_stats("metadata", state.meta_hub.stats)
+
 @app.get("/video_feed")
-def video_feed():
-    return get_video_feed_response()
+async def video_feed(fps: float = None, scale: float = None, quality: int = None):
+    return get_video_feed_response(max_fps=fps, scale=scale, quality=quality)
+
+@app.get("/video_feed/{camera_id}")
+async def camera_video_feed(camera_id: str, fps: float = None, scale: float = None, quality: int = None):
+    return get_video_feed_response(max_fps=fps, scale=scale, quality=quality, camera_id=camera_id)
+
+@app.websocket("/ws/video")
+async def video_ws(websocket: WebSocket, fps: float = None, scale: float = None, quality: int = None):
+    await stream_websocket(websocket, max_fps=fps, scale=scale, quality=quality)
+
+@app.websocket("/ws/video/{camera_id}")
+async def camera_video_ws(websocket: WebSocket, camera_id: str, fps: float = None, scale: float = None, quality: int = None):
+    await stream_websocket(websocket, max_fps=fps, scale=scale, quality=quality, camera_id=camera_id)
+
+@app.websocket("/ws/meta")
+async def meta_ws(websocket: WebSocket, fps: float = None):
+    await stream_metadata_websocket(websocket, max_fps=fps)
+
+@app.websocket("/ws/meta/{camera_id}")
+async def camera_meta_ws(websocket: WebSocket, camera_id: str, fps: float = None):
+    await stream_metadata_websocket(websocket, max_fps=fps, camera_id=camera_id)
+
+@app.get("/stats")
+def stats():
+    return collect_stats()
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @ui.page('/')
 async def main_page():
@@ -36,7 +72,8 @@ async def shutdown_handler():
             cam=state.global_cam_ref, 
             led_pin=state.global_led_pin, 
             gpio_enabled=state.global_gpio_enabled, 
-            logger=logger
+            logger=logger,
+            led_pins=state.global_led_pins
         )
     except: pass
 
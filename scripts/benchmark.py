@@ -0,0 +1,267 @@
+"""
+Replay benchmark for the detection pipeline.
+
+Feeds recorded video (e.g. logs/videos/evidence_*.mp4) or a directory of frames through the
+same DetectionPipeline code the device runs (capture hook, crop/detect/track/classify/alert,
+render/encode), single-threaded, and prints per-stage latency percentiles, fps, CPU time and
+peak RSS as JSON.
+
+    python scripts/benchmark.py logs/videos/evidence_20250101_120000.mp4
+    python scripts/benchmark.py data/raw_yolo --realtime --fps 15 --viewers 1
+    python scripts/benchmark.py clip.mp4 --set detect_max_fps=30 --set yolo_session.intra_op_num_threads=4
+    python scripts/benchmark.py synthetic --jpeg --max-frames 500
+
+By default frames are fed as fast as possible; the detect scheduler, drowsiness timers and clip
+recorder then run on the replayed timeline (each frame's position in its source), so they make the
+same decisions as on a live camera at the source rate. Evidence clips and snapshots produced during
+the run go to a scratch directory.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import global_state as state
+from src.config import ConfigManager
+from src.capture import CapturedFrame
+from src.sources import VideoFileSource, ImageDirSource, SyntheticSource
+from src.broadcast import FrameHub, StreamClient
+
+
+def open_sources(paths, args):
+    """One non-looping FrameSource per input: video file, image directory, or `synthetic`."""
+    sources = []
+    for path in paths:
+        if path == "synthetic":
+            source = SyntheticSource(fps=args.fps or 15.0, pace=args.realtime, passthrough=args.jpeg)
+        elif os.path.isdir(path):
+            source = ImageDirSource(path, fps=args.fps or 15.0, loop=False, pace=args.realtime, passthrough=args.jpeg)
+        else:
+            source = VideoFileSource(path, fps=args.fps, loop=False, pace=args.realtime)
+        if not source.open():
+            sys.exit(f"Cannot open {path}")
+        sources.append(source)
+    return sources
+
+
+def iter_frames(paths, args):
+    """CapturedFrames from every input in order, --loops times."""
+    for _ in range(args.loops):
+        for source in open_sources(paths, args):
+            while not source.finished:
+                frame = source.read()
+                if frame is not None:
+                    yield frame, source
+            source.release()
+
+
+class StageTimer:
+    """Collects wall-clock samples per stage; wrap() instruments a method on a live object."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds * 1000)
+
+    def wrap(self, obj, attr, name):
+        original = getattr(obj, attr)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+
+        setattr(obj, attr, timed)
+
+    def report(self):
+        result = {}
+        for name, values in self.samples.items():
+            arr = np.asarray(values)
+            result[name] = {
+                "count": int(arr.size),
+                "mean": round(float(arr.mean()), 3),
+                "p50": round(float(np.percentile(arr, 50)), 3),
+                "p90": round(float(np.percentile(arr, 90)), 3),
+                "p99": round(float(np.percentile(arr, 99)), 3),
+                "max": round(float(arr.max()), 3),
+            }
+        return result
+
+
+def apply_overrides(overrides):
+    """--set key=value (value parsed as YAML); dotted keys update one field of a nested section."""
+    for item in overrides:
+        key, _, raw = item.partition("=")
+        value = yaml.safe_load(raw)
+        if "." in key:
+            section, field = key.split(".", 1)
+            nested = dict(state.config_mgr.get(section) or {})
+            nested[field] = value
+            state.config_mgr.set(section, nested)
+        else:
+            state.config_mgr.set(key, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded video through the detection pipeline and report timings as JSON")
+    parser.add_argument("sources", nargs="+", help="video files, directories of frames, or `synthetic`")
+    parser.add_argument("--config", default=os.path.join(ROOT, "configs", "configs.yaml"))
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--realtime", action="store_true", help="pace frames at the source rate instead of as fast as possible")
+    parser.add_argument("--fps", type=float, help="source frame rate (default: from the video, else 15)")
+    parser.add_argument("--loops", type=int, default=1)
+    parser.add_argument("--max-frames", type=int, default=0)
+    parser.add_argument("--jpeg", action="store_true", help="hand frames over as JPEG bytes, like camera passthrough")
+    parser.add_argument("--viewers", type=int, default=0, help="simulated stream viewers of the default variant")
+    parser.add_argument("--wait-encodes", action="store_true", help="wait for evidence encodes and include them in CPU time")
+    parser.add_argument("--output", help="write the JSON report here as well")
+    parser.add_argument("--keep-scratch", action="store_true")
+    args = parser.parse_args()
+
+    if "synthetic" in args.sources and not args.max_frames:
+        sys.exit("A synthetic source never ends; set --max-frames")
+    paths = [p if p == "synthetic" else os.path.abspath(p) for p in args.sources]
+    # Relative to the caller's cwd; the run itself happens in a scratch dir
+    output = os.path.abspath(args.output) if args.output else None
+    state.config_mgr = ConfigManager(os.path.abspath(args.config))
+    apply_overrides(args.overrides)
+    for key in ("yolo_path", "eye_model_path"):
+        path = state.config_mgr.get(key)
+        if path and not os.path.isabs(path):
+            state.config_mgr.set(key, os.path.join(ROOT, path))
+
+    # Evidence, snapshots and collected samples land in a scratch dir, not the device's logs/
+    scratch = tempfile.mkdtemp(prefix="qaeye-bench-")
+    os.chdir(scratch)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    logger = logging.getLogger("benchmark")
+
+    from src.detection import DetectionPipeline
+
+    # Never touch the relay: replaying drowsy clips on a device would switch the real alarm
+    pipeline = DetectionPipeline(logger, gpio=False)
+    # Frames come faster than real time in max mode; run the detect scheduler, drowsiness timers
+    # and clip recorder on the replayed timeline so they behave as they would live
+    pipeline.replay_clock = not args.realtime
+    timer = StageTimer()
+    timer.wrap(pipeline.yolo, "detect", "detect")
+    timer.wrap(pipeline.classifier, "predict_batch", "classify")
+    timer.wrap(pipeline.tracker, "track", "track")
+    timer.wrap(pipeline, "annotate", "annotate")
+    timer.wrap(pipeline, "encode_variant", "encode")
+
+    channel = state.frame_hub._channel(FrameHub.DEFAULT_VARIANT)
+    for i in range(args.viewers):
+        channel.clients[-(i + 1)] = StreamClient(-(i + 1))
+
+    frames = alerts = 0
+    # Replay timeline: source positions made continuous across sources
+    clock_offset = 0.0
+    first_time = last_time = None
+    source_stats = {}
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    wall_start = time.perf_counter()
+
+    read_start = time.perf_counter()
+    for frame, source in iter_frames(paths, args):
+        if args.max_frames and frames >= args.max_frames:
+            break
+        frame_start = time.perf_counter()
+        # Includes the pacing wait with --realtime
+        timer.add("read", frame_start - read_start)
+        source_stats[getattr(source, "path", source.kind)] = source.stats()
+
+        if args.jpeg and frame.jpeg is None:
+            frame = CapturedFrame(jpeg=cv2.imencode('.jpg', frame.image, [int(cv2.IMWRITE_JPEG_QUALITY), 90])[1].tobytes(),
+                                  source_time=frame.source_time)
+        frame.seq = frames + 1
+        if frame.source_time is not None:
+            if last_time is not None and frame.source_time + clock_offset <= last_time:
+                # Next source (or a source without timestamps) starts over at 0
+                clock_offset = last_time + 1.0 / source.fps - frame.source_time
+            frame.source_time += clock_offset
+            first_time = frame.source_time if first_time is None else first_time
+            last_time = frame.source_time
+
+        start = time.perf_counter()
+        pipeline.on_captured(frame)
+        timer.add("capture_hook", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        job = pipeline.process_frame(frame)
+        timer.add("process", time.perf_counter() - start)
+        alerts += int(job["snapshot"])
+
+        start = time.perf_counter()
+        pipeline.render_job(job)
+        timer.add("render", time.perf_counter() - start)
+
+        timer.add("total", time.perf_counter() - frame_start)
+        frames += 1
+        read_start = time.perf_counter()
+
+    wall = time.perf_counter() - wall_start
+    pipeline.recorder.close()
+    if args.wait_encodes:
+        # Give the encode worker a moment to pick up the job close() just queued
+        time.sleep(0.5)
+        while True:
+            stats = pipeline.encode_queue.stats()
+            if stats["depth"] == 0 and stats["running"] == 0 and stats["live"] == 0:
+                break
+            time.sleep(0.1)
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    report = {
+        "sources": args.sources,
+        "mode": "realtime" if args.realtime else "max",
+        "clock": "source" if pipeline.replay_clock else "wall",
+        "replay_seconds": round(last_time - first_time, 3) if first_time is not None else 0.0,
+        "frames": frames,
+        "wall_seconds": round(wall, 3),
+        "fps": round(frames / wall, 2) if wall > 0 else 0.0,
+        "source": list(source_stats.values()),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_per_frame_ms": round(cpu / frames * 1000, 3) if frames else 0.0,
+        "cpu_utilization": round(cpu / wall, 3) if wall > 0 else 0.0,
+        "child_cpu_seconds": round(children.ru_utime + children.ru_stime, 3),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(usage_end.ru_maxrss / 1024, 1),
+        "alerts": alerts,
+        "stages_ms": timer.report(),
+        "scheduler": pipeline.scheduler.stats(now=last_time if pipeline.replay_clock else None),
+        "recorder": pipeline.recorder.stats(),
+        "encode": pipeline.encode_queue.stats(),
+        "models": pipeline.model_report,
+        "overrides": args.overrides,
+    }
+
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    if not args.keep_scratch:
+        os.chdir(ROOT)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
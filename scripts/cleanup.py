@@ -1,4 +1,5 @@
 import os
+import re
 import time
 import datetime
 
@@ -11,6 +12,11 @@ DIRS_TO_CLEAN = [
 DAYS_TO_KEEP = 7
 SECONDS_TO_KEEP = DAYS_TO_KEEP * 86400
 
+# The recorder's encode journal, clip spools still waiting for (or resumable by) the encoder,
+# and failed_*.mjpeg kept for manual recovery are never aged out
+KEEP_FILES = {"encode_journal.json"}
+KEEP_PATTERN = re.compile(r"(temp|failed)_.*\.mjpeg$")
+
 def cleanup_files():
     now = time.time()
     print(f"[{datetime.datetime.now()}] Bắt đầu dọn dẹp logs cũ hơn {DAYS_TO_KEEP} ngày...")
@@ -22,12 +28,14 @@ def cleanup_files():
             print(f"Thư mục không tồn tại: {folder}, bỏ qua.")
             continue
 
-        for filename in os.listdir(folder):
-            file_path = os.path.join(folder, filename)
-            
-            if os.path.isfile(file_path):
+        # Per-camera subfolders (logs/videos/<camera id>) are cleaned too
+        for root, _, filenames in os.walk(folder):
+            for filename in filenames:
+                if filename in KEEP_FILES or KEEP_PATTERN.match(filename):
+                    continue
+                file_path = os.path.join(root, filename)
                 file_age = os.path.getmtime(file_path)
-                
+
                 if now - file_age > SECONDS_TO_KEEP:
                     try:
                         os.remove(file_path)
@@ -0,0 +1,317 @@
+"""
+INT8 quantization for the YOLO and eye models.
+
+Calibrates on the samples collected by data collection mode (data/raw_yolo and
+data/raw_eyes/{open,closed}), writes the quantized model next to the float one and a JSON report
+comparing size, latency and agreement with the float model. Point yolo_path / eye_model_path in
+configs/configs.yaml at the output to use it.
+
+    python scripts/quantize.py --kind yolo --model weights/yolo-17-12.onnx
+    python scripts/quantize.py --kind eye --model weights/tiny_attention_eye.onnx --mode dynamic
+
+Needs the `onnx` package (only for this tool, not at runtime).
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.models import YOLOModel, EyeClassifier
+from src.scheduler import box_iou
+
+YOLO_DATA_DIR = "data/raw_yolo"
+EYE_DATA_DIR = "data/raw_eyes"
+
+
+def list_samples(kind, limit, seed=0):
+    """[(path, label)] of calibration/evaluation images. label is 1 (open) / 0 (closed) for eyes, None for YOLO."""
+    if kind == "yolo":
+        samples = [(p, None) for p in sorted(glob.glob(os.path.join(YOLO_DATA_DIR, "*.jpg")))]
+    else:
+        samples = [(p, 1) for p in sorted(glob.glob(os.path.join(EYE_DATA_DIR, "open", "*.jpg")))]
+        samples += [(p, 0) for p in sorted(glob.glob(os.path.join(EYE_DATA_DIR, "closed", "*.jpg")))]
+    random.Random(seed).shuffle(samples)
+    return samples[:limit] if limit else samples
+
+
+def model_size(path):
+    """Bytes on disk, including an external .data file."""
+    size = os.path.getsize(path)
+    if os.path.exists(path + ".data"):
+        size += os.path.getsize(path + ".data")
+    return size
+
+
+def load_model(kind, path, args):
+    if kind == "yolo":
+        return YOLOModel(path, input_size=args.img_size or 224, conf_thres=args.conf, iou_thres=args.iou)
+    return EyeClassifier(path, input_size=args.img_size or 128)
+
+
+class ImageCalibrationReader:
+    """CalibrationDataReader that feeds images through the runtime preprocessing, so ranges match production inputs."""
+
+    def __init__(self, model, samples):
+        self.model = model
+        self.samples = list(samples)
+        self.input_name = model.session.get_inputs()[0].name
+        self.index = 0
+
+    def get_next(self):
+        while self.index < len(self.samples):
+            img = cv2.imread(self.samples[self.index][0])
+            self.index += 1
+            if img is None:
+                continue
+            # preprocess() returns a reused buffer; the calibrator may keep it
+            tensor = self.model.preprocess(img)
+            tensor = tensor[0] if isinstance(tensor, tuple) else tensor
+            return {self.input_name: tensor.copy()}
+        return None
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize(args, samples):
+    try:
+        from onnxruntime import quantization as q
+    except ImportError as e:
+        sys.exit(f"onnxruntime.quantization is unavailable ({e}); install the `onnx` package first")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = prepare_source(args, workdir, q)
+        if args.mode == "dynamic":
+            q.quantize_dynamic(
+                source, args.output,
+                weight_type=q.QuantType.QInt8 if args.weight_type == "int8" else q.QuantType.QUInt8,
+                per_channel=args.per_channel,
+            )
+        else:
+            if not samples:
+                sys.exit("Static quantization needs calibration images; enable data collection or use --mode dynamic")
+            reader = ImageCalibrationReader(load_model(args.kind, args.model, args), samples[:args.calib_samples])
+            q.quantize_static(
+                source, args.output, reader,
+                quant_format=q.QuantFormat.QDQ,
+                activation_type=q.QuantType.QUInt8,
+                weight_type=q.QuantType.QInt8 if args.weight_type == "int8" else q.QuantType.QUInt8,
+                per_channel=args.per_channel,
+                calibrate_method={
+                    "minmax": q.CalibrationMethod.MinMax,
+                    "entropy": q.CalibrationMethod.Entropy,
+                    "percentile": q.CalibrationMethod.Percentile,
+                }[args.calibration],
+            )
+
+
+def prepare_source(args, workdir, q):
+    """
+    Self-contained copy of the float model for the quantizer: external .data weights inlined
+    and stale value_info from the export dropped (it trips onnx shape inference), then
+    onnxruntime's recommended pre-processing when it succeeds.
+    """
+    import onnx
+
+    model = onnx.load(args.model)
+    del model.graph.value_info[:]
+    source = os.path.join(workdir, "float.onnx")
+    onnx.save(model, source)
+    if args.no_preprocess:
+        return source
+
+    prepared = os.path.join(workdir, "prepared.onnx")
+    for skip_symbolic in (False, True):
+        try:
+            q.quant_pre_process(source, prepared, skip_symbolic_shape=skip_symbolic)
+            return prepared
+        except Exception as e:
+            error = e
+    print(f"[QUANT] Pre-processing skipped: {error}")
+    return source
+
+
+def latency_ms(run, inputs, repeats):
+    times = []
+    for _ in range(repeats):
+        for x in inputs:
+            start = time.perf_counter()
+            run(x)
+            times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        "p50": round(times[len(times) // 2], 3),
+        "p90": round(times[int(len(times) * 0.9)], 3),
+        "mean": round(sum(times) / len(times), 3),
+    }
+
+
+def match_boxes(reference, candidate, iou_thres=0.5):
+    """Greedy one-to-one matching; returns the number of matched pairs."""
+    used, matched = set(), 0
+    for a in reference:
+        best, best_iou = None, iou_thres
+        for j, b in enumerate(candidate):
+            if j in used:
+                continue
+            iou = box_iou(a, b)
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is not None:
+            used.add(best)
+            matched += 1
+    return matched
+
+
+def compare(args, samples):
+    float_model = load_model(args.kind, args.model, args)
+    quant_model = load_model(args.kind, args.output, args)
+
+    def images():
+        # Read lazily: a few hundred full frames don't need to sit in memory together
+        found = False
+        for path, label in samples:
+            img = cv2.imread(path)
+            if img is not None:
+                found = True
+                yield img, label
+        if not found:
+            print("[QUANT] No evaluation images found; latency only, on a random input")
+            yield np.random.randint(0, 256, (480, 640, 3) if args.kind == "yolo" else (40, 60, 3), np.uint8), None
+
+    report = {
+        "kind": args.kind,
+        "mode": args.mode,
+        "float_model": args.model,
+        "quant_model": args.output,
+        "float_bytes": model_size(args.model),
+        "quant_bytes": model_size(args.output),
+    }
+    report["size_ratio"] = round(report["quant_bytes"] / report["float_bytes"], 3)
+
+    bench = [img for img, _ in itertools.islice(images(), args.bench_samples)]
+    if args.kind == "yolo":
+        report["float_latency_ms"] = latency_ms(float_model.detect, bench, args.repeats)
+        report["quant_latency_ms"] = latency_ms(quant_model.detect, bench, args.repeats)
+        ref_total = cand_total = matched = count = 0
+        for img, _ in images():
+            count += 1
+            ref, cand = float_model.detect(img), quant_model.detect(img)
+            ref_total, cand_total = ref_total + len(ref), cand_total + len(cand)
+            matched += match_boxes(ref, cand)
+        report["float_boxes"] = ref_total
+        report["quant_boxes"] = cand_total
+        report["box_recall_vs_float"] = round(matched / ref_total, 4) if ref_total else None
+        report["box_precision_vs_float"] = round(matched / cand_total, 4) if cand_total else None
+    else:
+        report["float_latency_ms"] = latency_ms(float_model.predict, bench, args.repeats)
+        report["quant_latency_ms"] = latency_ms(quant_model.predict, bench, args.repeats)
+        agree = correct_float = correct_quant = labelled = count = 0
+        prob_diff = []
+        for img, label in images():
+            count += 1
+            f_pred, f_prob = float_model.predict(img, thres=args.eye_threshold)
+            q_pred, q_prob = quant_model.predict(img, thres=args.eye_threshold)
+            agree += int(f_pred == q_pred)
+            prob_diff.append(abs(f_prob - q_prob))
+            if label is not None:
+                labelled += 1
+                correct_float += int(f_pred == label)
+                correct_quant += int(q_pred == label)
+        report["decision_agreement"] = round(agree / count, 4)
+        report["mean_abs_prob_diff"] = round(float(np.mean(prob_diff)), 5)
+        report["max_abs_prob_diff"] = round(float(np.max(prob_diff)), 5)
+        if labelled:
+            report["float_accuracy"] = round(correct_float / labelled, 4)
+            report["quant_accuracy"] = round(correct_quant / labelled, 4)
+
+    report["samples"] = count
+    report["speedup"] = round(report["float_latency_ms"]["p50"] / max(report["quant_latency_ms"]["p50"], 1e-6), 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the YOLO or eye model to INT8 and compare it with the float model")
+    parser.add_argument("--kind", choices=["yolo", "eye"], required=True)
+    parser.add_argument("--model", required=True, help="float ONNX model")
+    parser.add_argument("--output", help="quantized model path (default: <model>.int8.onnx / .dynamic.onnx)")
+    parser.add_argument("--mode", choices=["static", "dynamic"], default="static")
+    parser.add_argument("--calibration", choices=["minmax", "entropy", "percentile"], default="minmax")
+    parser.add_argument("--weight-type", choices=["int8", "uint8"], default="int8")
+    parser.add_argument("--per-channel", action="store_true")
+    parser.add_argument("--no-preprocess", action="store_true", help="skip quant_pre_process")
+    parser.add_argument("--calib-samples", type=int, default=200)
+    parser.add_argument("--eval-samples", type=int, default=500)
+    parser.add_argument("--bench-samples", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--img-size", type=int, help="model input size (default 224 for YOLO, 128 for eye)")
+    parser.add_argument("--config", default=os.path.join(ROOT, "configs", "configs.yaml"),
+                        help="device config the threshold defaults are read from")
+    parser.add_argument("--conf", type=float, help="default: conf_threshold from --config")
+    parser.add_argument("--iou", type=float, help="default: iou_threshold from --config")
+    parser.add_argument("--eye-threshold", type=float, help="default: eye_closed_threshold from --config")
+    parser.add_argument("--report", help="JSON report path (default: <output>.report.json)")
+    parser.add_argument("--report-only", action="store_true", help="compare an existing --output without re-quantizing")
+    args = parser.parse_args()
+
+    if not args.output:
+        root, _ = os.path.splitext(args.model)
+        args.output = f"{root}.{'int8' if args.mode == 'static' else 'dynamic'}.onnx"
+    args.report = args.report or os.path.splitext(args.output)[0] + ".report.json"
+
+    # Measure agreement at the thresholds the device runs with
+    try:
+        with open(args.config) as f:
+            config = yaml.safe_load(f) or {}
+    except OSError:
+        config = {}
+    if args.conf is None:
+        args.conf = float(config.get("conf_threshold", 0.3))
+    if args.iou is None:
+        args.iou = float(config.get("iou_threshold", 0.35))
+    if args.eye_threshold is None:
+        args.eye_threshold = float(config.get("eye_closed_threshold", 0.8))
+
+    samples = list_samples(args.kind, args.calib_samples + args.eval_samples)
+    print(f"[QUANT] {len(samples)} {args.kind} samples found")
+
+    if not args.report_only:
+        start = time.perf_counter()
+        quantize(args, samples)
+        print(f"[QUANT] Wrote {args.output} in {time.perf_counter() - start:.1f}s")
+
+    # Evaluate on samples not used for calibration when there are enough of them
+    calibrated = args.mode == "static"
+    held_out = calibrated and len(samples) > args.calib_samples
+    eval_samples = (samples[args.calib_samples:] if held_out else samples)[:args.eval_samples]
+    overlap = calibrated and not held_out and bool(samples)
+    if overlap:
+        print(f"[QUANT] Only {len(samples)} samples: evaluating on the calibration set, agreement will look better than it is")
+    report = compare(args, eval_samples)
+    report.update({
+        "thresholds": {"conf": args.conf, "iou": args.iou, "eye": args.eye_threshold},
+        "calibration_samples": min(len(samples), args.calib_samples) if calibrated else 0,
+        "eval_samples": len(eval_samples),
+        "eval_overlaps_calibration": overlap,
+    })
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    key = "yolo_path" if args.kind == "yolo" else "eye_model_path"
+    print(f"[QUANT] Report: {args.report}\n[QUANT] To use it set `{key}: {args.output}` in configs/configs.yaml")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import threading
+import time
+
+
+class StreamClient:
+    """Per-viewer bookkeeping for the stats endpoint."""
+
+    def __init__(self, client_id, max_fps=None):
+        self.id = client_id
+        self.max_fps = max_fps
+        self.connected_at = time.monotonic()
+        self.last_seq = 0
+        self.sent = 0
+        self.dropped = 0
+        self.lag_ms = 0.0
+
+    def stats(self):
+        return {
+            "id": self.id,
+            "max_fps": self.max_fps,
+            "seconds": round(time.monotonic() - self.connected_at, 1),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "lag_ms": round(self.lag_ms, 1),
+        }
+
+
+class StreamChannel:
+    """Latest frame of one (scale, quality) variant and the viewers subscribed to it."""
+
+    def __init__(self):
+        self.seq = 0
+        self.latest = None
+        self.published_at = 0.0
+        self.clients = {}
+        self.wakeup = None
+        self.bytes_published = 0
+
+
+class FrameHub:
+    """
+    One producer, many viewers. The render thread publishes each JPEG once with an increasing
+    sequence number; every viewer is an async generator on the event loop that waits for a newer
+    sequence number and always jumps to the latest frame, so a slow viewer drops frames instead of
+    slowing the producer or the other viewers.
+
+    Frames are published per variant (scale, JPEG quality). The producer only encodes the
+    variants in active_variants(), once per frame, however many viewers share each one.
+    """
+
+    DEFAULT_VARIANT = (1.0, 45)
+
+    def __init__(self, keepalive_seconds=1.0):
+        self.keepalive_seconds = keepalive_seconds
+        self.lock = threading.Lock()
+        self.channels = {}
+        self._ids = itertools.count(1)
+        self._loop = None
+
+    @staticmethod
+    def variant_key(scale=None, quality=None):
+        """Snap requested scale/quality to a small set of steps so similar requests share one encode."""
+        default_scale, default_quality = FrameHub.DEFAULT_VARIANT
+        scale = default_scale if scale is None else min(1.0, max(0.1, round(float(scale) * 20) / 20))
+        quality = default_quality if quality is None else min(95, max(10, int(round(float(quality) / 5)) * 5))
+        return (scale, quality)
+
+    def _channel(self, variant):
+        with self.lock:
+            channel = self.channels.get(variant)
+            if channel is None:
+                channel = self.channels[variant] = StreamChannel()
+            return channel
+
+    @property
+    def viewers(self):
+        return sum(len(c.clients) for c in list(self.channels.values()))
+
+    def active_variants(self):
+        return [v for v, c in list(self.channels.items()) if c.clients]
+
+    def publish(self, jpeg, variant=DEFAULT_VARIANT):
+        """Called from the producer thread."""
+        channel = self._channel(variant)
+        with self.lock:
+            channel.seq += 1
+            channel.latest = jpeg
+            channel.published_at = time.monotonic()
+            channel.bytes_published += len(jpeg)
+            loop = self._loop
+        if loop is not None and channel.clients:
+            try:
+                loop.call_soon_threadsafe(self._wake, channel)
+            except RuntimeError:
+                # Event loop already closed (shutdown)
+                self._loop = None
+
+    @staticmethod
+    def _wake(channel):
+        # Runs on the event loop: release everyone waiting on this generation, arm the next one
+        wakeup, channel.wakeup = channel.wakeup, asyncio.Event()
+        wakeup.set()
+
+    def current(self, variant=DEFAULT_VARIANT):
+        channel = self._channel(variant)
+        with self.lock:
+            return channel.seq, channel.latest, channel.published_at
+
+    async def frames(self, max_fps=None, variant=DEFAULT_VARIANT):
+        """Async generator of JPEG bytes for one viewer. Repeats the last frame every keepalive_seconds when idle."""
+        self._loop = asyncio.get_running_loop()
+        channel = self._channel(variant)
+        if channel.wakeup is None:
+            channel.wakeup = asyncio.Event()
+
+        client = StreamClient(next(self._ids), max_fps)
+        channel.clients[client.id] = client
+        min_interval = 1.0 / max_fps if max_fps else 0.0
+        try:
+            while True:
+                wakeup = channel.wakeup
+                seq, jpeg, published_at = self.current(variant)
+                if seq == client.last_seq or jpeg is None:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout=self.keepalive_seconds)
+                        continue
+                    except asyncio.TimeoutError:
+                        if jpeg is None:
+                            yield None
+                            continue
+                        # Keepalive: resend the frame we already have
+                else:
+                    if client.last_seq:
+                        client.dropped += seq - client.last_seq - 1
+                    client.last_seq = seq
+                    now = time.monotonic()
+                    lag = (now - published_at) * 1000
+                    client.lag_ms = lag if client.sent == 0 else 0.9 * client.lag_ms + 0.1 * lag
+
+                client.sent += 1
+                sent_at = time.monotonic()
+                yield jpeg
+
+                if min_interval:
+                    remaining = min_interval - (time.monotonic() - sent_at)
+                    if remaining > 0:
+                        await asyncio.sleep(remaining)
+        finally:
+            channel.clients.pop(client.id, None)
+
+    def stats(self):
+        with self.lock:
+            channels = [(v, c, c.seq, c.bytes_published) for v, c in self.channels.items()]
+        return {
+            "viewers": self.viewers,
+            "variants": [
+                {
+                    "scale": scale,
+                    "quality": quality,
+                    "published": seq,
+                    "avg_kb": round(size / seq / 1024, 1) if seq else 0.0,
+                    "clients": [c.stats() for c in list(channel.clients.values())],
+                }
+                for (scale, quality), channel, seq, size in channels
+                if channel.clients or seq
+            ],
+        }
@@ -0,0 +1,237 @@
+import time
+import threading
+import cv2
+import numpy as np
+
+from src.pipeline import LatestQueue
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def jpeg_size(data):
+    """(width, height) from the SOF header of a JPEG, without decoding it. None if not found."""
+    i, n = 2, len(data)
+    if n < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01:
+            i += 2
+            continue
+        length = (data[i + 2] << 8) | data[i + 3]
+        # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+class CapturedFrame:
+    """
+    One camera frame, either as the camera's own MJPEG bytes or as a decoded BGR image.
+
+    With bytes, nothing is decoded up front: `reduced(n)` decodes at 1/n scale inside libjpeg
+    for detection, and `image` decodes full resolution only the first time something needs
+    pixels (eye crops, tracking, overlays). The bytes can be forwarded to the stream and the
+    recorder as they are.
+    """
+
+    __slots__ = ("jpeg", "seq", "captured_at", "source_time", "_image", "_reduced", "_size")
+
+    def __init__(self, jpeg=None, image=None, seq=0, captured_at=None, source_time=None):
+        self.jpeg = jpeg
+        self.seq = seq
+        self.captured_at = time.monotonic() if captured_at is None else captured_at
+        # Position in the source (seconds), as reported by the FrameSource
+        self.source_time = source_time
+        self._image = image
+        self._reduced = {}
+        self._size = None
+
+    @classmethod
+    def wrap(cls, frame):
+        return frame if isinstance(frame, cls) else cls(image=frame)
+
+    @property
+    def decoded(self):
+        return self._image is not None
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return self._image
+
+    @property
+    def shape(self):
+        if self._image is not None:
+            return self._image.shape
+        if self._size is None:
+            self._size = jpeg_size(self.jpeg)
+            if self._size is None:
+                return self.image.shape
+        w, h = self._size
+        return (h, w, 3)
+
+    def reduced(self, factor):
+        """The frame at roughly 1/factor scale. Reuses the full image if it's already decoded."""
+        if factor <= 1 or self._image is not None or self.jpeg is None:
+            return self.image
+        if factor not in self._reduced:
+            img = cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR))
+            self._reduced[factor] = img
+        return self._reduced[factor]
+
+
+class CaptureWorker:
+    """
+    Owns the frame source (see src/sources.py). A dedicated thread reads as fast as the source
+    delivers, stamps each frame with a sequence number and monotonic capture time, and publishes
+    only the newest one, so a slow consumer never leaves stale frames in the V4L2 buffer. If reads
+    keep failing the source is released and reopened with exponential backoff; a file source that
+    ends without looping stops the thread.
+    """
+
+    FAILURES_BEFORE_REOPEN = 10
+
+    def __init__(self, source, stop_event=None, logger=None, on_frame=None, max_backoff=8.0, name="capture"):
+        self.source = source
+        self.name = name
+        # Shared shutdown signal; release() only stops this worker via its own event
+        self.stop_event = stop_event or threading.Event()
+        self.released = threading.Event()
+        self.logger = logger
+        # Called on the capture thread for every frame (e.g. the evidence pre-buffer)
+        self.on_frame = on_frame
+        self.max_backoff = max_backoff
+        self.queue = LatestQueue(name, maxsize=1)
+        self.thread = None
+
+        self.seq = 0
+        self.failures = 0
+        self.reopens = 0
+        self.last_error = None
+        self.consumed_seq = 0
+        self.skipped = 0
+        self.age_ms = 0.0
+        self.fps = 0.0
+        self._fps_window = (time.monotonic(), 0)
+
+    def _log(self, level, message):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+    def open(self):
+        return self.source.open()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def stopping(self):
+        return self.released.is_set() or self.stop_event.is_set()
+
+    def _wait(self, timeout):
+        """Sleep up to timeout; True if the worker was told to stop meanwhile."""
+        deadline = time.monotonic() + timeout
+        while not self.stopping():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.released.wait(min(remaining, 0.1))
+        return True
+
+    def release(self):
+        self.released.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        self.source.release()
+
+    def reopen(self, backoff):
+        self.reopens += 1
+        self._log("warning", f"Frame source read failing ({self.last_error}), reopening in {backoff:.1f}s")
+        self.source.release()
+        if self._wait(backoff):
+            return False
+        return self.open()
+
+    def run(self):
+        backoff = 0.5
+        if not self.open():
+            self.last_error = "open failed"
+        while not self.stopping():
+            passthrough = getattr(self.source, "passthrough", False)
+            frame = self.source.read() if self.source.isOpened() else None
+            if frame is None:
+                if self.source.finished:
+                    self._log("info", f"Frame source {self.source.kind} finished after {self.seq} frames")
+                    break
+                if passthrough and not getattr(self.source, "passthrough", False):
+                    self._log("warning", "Camera MJPEG passthrough unusable, falling back to decoded frames")
+                    continue
+                self.failures += 1
+                self.last_error = self.last_error or "read failed"
+                if self.failures >= self.FAILURES_BEFORE_REOPEN or not self.isOpened():
+                    if self.reopen(backoff):
+                        self.failures = 0
+                    backoff = min(backoff * 2, self.max_backoff)
+                else:
+                    time.sleep(0.05)
+                continue
+
+            self.failures, self.last_error, backoff = 0, None, 0.5
+            self.seq += 1
+            frame.seq = self.seq
+            self._count_fps(frame.captured_at)
+            if self.on_frame is not None:
+                self.on_frame(frame)
+            self.queue.put(frame)
+
+    def _count_fps(self, now):
+        start, count = self._fps_window
+        count += 1
+        if now - start >= 2.0:
+            self.fps = count / (now - start)
+            start, count = now, 0
+        self._fps_window = (start, count)
+
+    def get(self, timeout=None):
+        """Newest frame (or None on timeout). Tracks how many frames the consumer never saw and how old they are."""
+        frame = self.queue.get(timeout=timeout)
+        if frame is not None:
+            if self.consumed_seq:
+                self.skipped += max(0, frame.seq - self.consumed_seq - 1)
+            self.consumed_seq = frame.seq
+            age = (time.monotonic() - frame.captured_at) * 1000
+            self.age_ms = age if self.age_ms == 0.0 else 0.9 * self.age_ms + 0.1 * age
+        return frame
+
+    def stats(self):
+        return {
+            "opened": self.isOpened(),
+            "source": self.source.stats(),
+            "fps": round(self.fps, 2),
+            "seq": self.seq,
+            "skipped": self.skipped,
+            "age_ms": round(self.age_ms, 2),
+            "failures": self.failures,
+            "reopens": self.reopens,
+            "last_error": self.last_error,
+        }
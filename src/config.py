@@ -1,54 +1,144 @@
 import yaml
 import threading
 import os
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+def _freeze(value):
+    """Read-only copy of a YAML value: mappings become MappingProxyType, lists become tuples."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    """Plain dicts and lists again, for YAML and for callers that want a mutable copy."""
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class ConfigSnapshot(Mapping):
+    """
+    Immutable view of the config at one version. Readers keep a reference; writers publish a new one.
+    Nested sections (yolo_session, cameras, ...) are frozen copies, so they can't change under a reader either.
+    """
+
+    __slots__ = ("version", "_data")
+
+    def __init__(self, data, version):
+        self._data = {k: _freeze(v) for k, v in data.items()}
+        self.version = version
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
 
 class ConfigManager:
     def __init__(self, yaml_path="configs/configs.yaml"):
         self.yaml_path = yaml_path
+        # Serializes writers only; readers never take it
         self.lock = threading.Lock()
-        self.config = {}
+        self._snapshot = ConfigSnapshot({}, 0)
+        self._camera_views = {}
         try:
             self.load()
         except Exception:
-            self.config = {}
-        
+            self._publish({})
+
         with self.lock:
-            self.config.setdefault("crop_enabled", False)
-            self.config.setdefault("crop_x", 0)
-            self.config.setdefault("crop_y", 0)
-            self.config.setdefault("crop_w", 640)
-            self.config.setdefault("crop_h", 480)
-            self.config.setdefault("conf_threshold", 0.3)
-            self.config.setdefault("drowsy_time_threshold", 2.0)
-            self.config.setdefault("frame_rate", 30)
-            self.config.setdefault("led_pin", 21)
-            self.config.setdefault("yolo_path", "weights/new-best.onnx")
-            self.config.setdefault("eye_model_path", "weights/eye_model.onnx")
-            self.config.setdefault("yolo_img_size", 224)
-            self.config.setdefault("iou_threshold", 0.35)
-            self.config.setdefault("eye_img_size", 128)
+            config = dict(self._snapshot)
+            config.setdefault("source_type", "v4l2")
+            config.setdefault("camera_index", 0)
+            config.setdefault("camera_width", 1280)
+            config.setdefault("camera_height", 720)
+            config.setdefault("crop_enabled", False)
+            config.setdefault("crop_x", 0)
+            config.setdefault("crop_y", 0)
+            config.setdefault("crop_w", 640)
+            config.setdefault("crop_h", 480)
+            config.setdefault("conf_threshold", 0.3)
+            config.setdefault("drowsy_time_threshold", 2.0)
+            config.setdefault("frame_rate", 30)
+            config.setdefault("led_pin", 21)
+            config.setdefault("yolo_path", "weights/new-best.onnx")
+            config.setdefault("eye_model_path", "weights/eye_model.onnx")
+            config.setdefault("yolo_img_size", 224)
+            config.setdefault("iou_threshold", 0.35)
+            config.setdefault("eye_img_size", 128)
+            self._publish(config)
+
+    def _publish(self, config):
+        self._snapshot = ConfigSnapshot(config, self._snapshot.version + 1)
+
+    @property
+    def config(self):
+        return self._snapshot
 
     def load(self):
         if not os.path.exists(self.yaml_path):
-            self.config = {}
+            self._publish({})
             return
         with open(self.yaml_path, "r") as f:
-            self.config = yaml.safe_load(f) or {}
+            self._publish(yaml.safe_load(f) or {})
+
+    def current(self):
+        """Latest immutable snapshot. One attribute read, no locking."""
+        return self._snapshot
+
+    def camera_ids(self):
+        """Ids from the `cameras` list (one section per camera), or [] for a single-camera setup."""
+        return [str(section.get("id", i)) for i, section in enumerate(self._snapshot.get("cameras") or [])]
+
+    def for_camera(self, camera_id):
+        """
+        Snapshot for one camera: the top-level settings overlaid with that camera's `cameras`
+        section. Same version as the snapshot it was built from; rebuilt only when that changes.
+        """
+        snapshot = self._snapshot
+        cached = self._camera_views.get(camera_id)
+        if cached is not None and cached.version == snapshot.version:
+            return cached
+        config = {k: v for k, v in snapshot.items() if k != "cameras"}
+        for i, section in enumerate(snapshot.get("cameras") or []):
+            if str(section.get("id", i)) == camera_id:
+                config.update(section)
+                break
+        view = ConfigSnapshot(config, snapshot.version)
+        self._camera_views[camera_id] = view
+        return view
 
     def get(self, key, default=None):
-        with self.lock:
-            return self.config.get(key, default)
+        return self._snapshot.get(key, default)
 
     def set(self, key, value):
         with self.lock:
-            self.config[key] = value
+            current = self._snapshot
+            if key in current and current[key] == value:
+                return
+            config = dict(current)
+            config[key] = value
+            self._publish(config)
 
     def save(self):
         with self.lock:
             os.makedirs(os.path.dirname(self.yaml_path), exist_ok=True)
             with open(self.yaml_path, "w") as f:
-                yaml.safe_dump(self.config, f)
+                yaml.safe_dump(_thaw(self._snapshot), f)
 
     def snapshot(self):
-        with self.lock:
-            return dict(self.config)
\ No newline at end of file
+        return _thaw(self._snapshot)
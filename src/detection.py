@@ -1,238 +1,643 @@
 import time
+import json
+import threading
 import cv2
+import numpy as np
 from collections import deque
 from datetime import datetime
 
 from src.models import YOLOModel, EyeClassifier
 from src.tracker import EyeTracker
 from src.utils import draw_hud_bbox, initialize_gpio, set_relay
-from src.recorder import EvidenceRecorder
+from src.recorder import EvidenceRecorder, EncodeQueue, SegmentRing
 from src.logger import save_suspected_frame
+from src.pipeline import LatestQueue, register_queue, register_stats
+from src.scheduler import DetectionScheduler
+from src.capture import CapturedFrame, CaptureWorker
+from src.inference import InferenceScheduler, SharedDetector, SharedClassifier
+from src.sources import make_source
+from src.broadcast import FrameHub
+from src.metrics import STAGES, frames_total, alerts_total
 import global_state as state
-import os 
+import os
+import re
 
 
-def run_detection_thread(logger):
+YOLO_DATA_DIR = "data/raw_yolo"
+EYE_OPEN_DIR = "data/raw_eyes/open"
+EYE_CLOSED_DIR = "data/raw_eyes/closed"
+
+
+class DetectionPipeline:
+    """
+    Capture -> detection/classification -> annotate/encode, each stage in its own thread.
+    Stages are joined by latest-wins queues so a slow stage drops stale frames instead of
+    adding latency. Alert and relay decisions are taken only by the inference stage, in frame order.
+    """
 
-    # Initialize Recorder
-    recorder = EvidenceRecorder(save_dir="logs/videos", buffer_seconds=3, fps=15)
-    
-    # Init Models & Hardware
-    EYE_CROP_SIZE = state.config_mgr.get("eye_img_size")
-    led_pin = state.config_mgr.get("led_pin", 21)
-    
-    gpio_enabled = initialize_gpio(led_pin, logger)
-    state.global_led_pin = led_pin
-    state.global_gpio_enabled = gpio_enabled
-    
-    yolo_path = state.config_mgr.get("yolo_path", "weights/new-best.onnx")
-    eye_path = state.config_mgr.get("eye_model_path", "weights/eye_model.onnx")
-    
-    yolo = YOLOModel(
-        yolo_path, 
-        input_size=state.config_mgr.get("yolo_img_size", 224), 
-        conf_thres=state.config_mgr.get("conf_threshold", 0.3), 
-        iou_thres=state.config_mgr.get("iou_threshold", 0.35)
-    )
-    classifier = EyeClassifier(eye_path, input_size=EYE_CROP_SIZE)
-    tracker = EyeTracker(drowsy_threshold=state.config_mgr.get("drowsy_time_threshold", 2.0))
-
-    prob_history = {"left": deque(maxlen=5), "right": deque(maxlen=5)}
-
-    # Init Camera
-    cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
-    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, state.CAM_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, state.CAM_HEIGHT)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1) 
-    state.global_cam_ref = cap 
-
-    # Loop variables
-    FRAME_SKIP = 2
-    frame_count = 0
-    last_worker_eyes = []
-    last_other_eyes = []
-    relay_on = False
-    is_drowsy_alert = False
     MAX_MISSING_FRAMES = 15
-    missing_frame_counter = 0
-    encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), 45]
 
+    def __init__(self, logger, camera_id=None, models=None, encode_queue=None, gpio=True):
+        """
+        camera_id selects a section of the `cameras` config list (None: single-camera setup).
+        With several cameras, `models` is the shared InferenceScheduler and `encode_queue` the
+        shared evidence encoder; a single camera builds its own. gpio=False leaves the relay pin
+        alone (offline tools such as the benchmark).
+        """
+        self.logger = logger
+        self.camera_id = camera_id
+        cfg = self.current_config()
+        # Stats, queues and file names carry the camera id when there is more than one
+        self.suffix = f".{camera_id}" if camera_id is not None else ""
+        self.file_tag = f"_{camera_id}" if camera_id is not None else ""
+        # Clips go to logs/videos/<camera id>, where the history page also looks
+        evidence_dir = os.path.join("logs/videos", camera_id) if camera_id is not None else "logs/videos"
+
+        # Initialize Recorder
+        if encode_queue is None:
+            encode_queue = EncodeQueue(
+                os.path.join(evidence_dir, "encode_journal.json"),
+                workers=cfg.get("evidence_encode_workers", 1)
+            )
+            encode_queue.recover([evidence_dir])
+            register_stats("encode_queue", encode_queue.stats)
+        self.encode_queue = encode_queue
+        segment_ring = None
+        if cfg.get("evidence_segment_mode", False):
+            segment_dir = cfg.get("evidence_segment_dir", "logs/segments")
+            segment_ring = SegmentRing(
+                segment_dir=os.path.join(segment_dir, camera_id) if camera_id is not None else segment_dir,
+                segment_seconds=cfg.get("evidence_segment_seconds", 10),
+                lookback_seconds=cfg.get("evidence_lookback_seconds", 120)
+            )
+        self.recorder = EvidenceRecorder(
+            save_dir=evidence_dir,
+            buffer_seconds=cfg.get("evidence_pre_seconds", 3),
+            post_seconds=cfg.get("evidence_post_seconds", 5),
+            max_clip_seconds=cfg.get("evidence_max_seconds", 60),
+            fps=15,
+            jpeg_quality=cfg.get("evidence_jpeg_quality", 80),
+            preset=cfg.get("evidence_preset", "ultrafast"),
+            crf=cfg.get("evidence_crf", 28),
+            encode_queue=self.encode_queue,
+            segment_ring=segment_ring,
+            lookback_seconds=cfg.get("evidence_lookback_seconds", 120),
+            live_encode=cfg.get("evidence_live_encode", True)
+        )
+        register_stats("recorder" + self.suffix, self.recorder.stats)
+
+        # Init Models & Hardware
+        self.led_pin = cfg.get("led_pin", 21)
+        self.gpio_enabled = initialize_gpio(self.led_pin, logger) if gpio else False
+        if gpio and (camera_id is None or not state.global_gpio_enabled):
+            state.global_led_pin = self.led_pin
+            state.global_gpio_enabled = self.gpio_enabled
+        if self.gpio_enabled and self.led_pin not in state.global_led_pins:
+            state.global_led_pins.append(self.led_pin)
+
+        if models is None:
+            self.yolo, self.classifier = load_models(cfg)
+            self.model_report = model_report(self.yolo, self.classifier)
+            for name, report in self.model_report.items():
+                self.logger.info(f"ONNX session [{name}]: " + ", ".join(f"{k}={v}" for k, v in report.items()))
+            register_stats("models", lambda: self.model_report)
+        else:
+            self.yolo = SharedDetector(models, camera_id, cfg.get("conf_threshold", 0.3), cfg.get("iou_threshold", 0.35))
+            self.classifier = SharedClassifier(models, camera_id)
+            self.model_report = model_report(models.yolo, models.classifier)
+        self.models = models
+        self.tracker = EyeTracker(drowsy_threshold=cfg.get("drowsy_time_threshold", 2.0))
+        self.scheduler = DetectionScheduler()
+        register_stats("scheduler" + self.suffix, self.scheduler.stats)
+
+        self.prob_history = {"left": deque(maxlen=5), "right": deque(maxlen=5)}
+
+        # Init Camera (or another frame source, selected by source_type)
+        # Passthrough keeps the camera's MJPEG bytes; frames are decoded only as far as each stage needs
+        self.decode_scale = int(cfg.get("detect_decode_scale", 2))
+        self.capture = CaptureWorker(
+            make_source(cfg),
+            stop_event=state.stop_event,
+            logger=logger,
+            on_frame=self.on_captured,
+            max_backoff=cfg.get("camera_reopen_max_backoff", 8.0),
+            name="capture" + self.suffix
+        )
+        if state.global_cam_ref is None or camera_id is None:
+            state.global_cam_ref = self.capture
+        register_stats("capture" + self.suffix, self.capture.stats)
+
+        # Stream hubs: the first camera also serves the unnumbered endpoints
+        if camera_id is None or not state.frame_hubs:
+            self.frame_hub, self.meta_hub = state.frame_hub, state.meta_hub
+        else:
+            self.frame_hub, self.meta_hub = FrameHub(), FrameHub()
+        if camera_id is not None:
+            state.frame_hubs[camera_id] = self.frame_hub
+            state.meta_hubs[camera_id] = self.meta_hub
+            register_stats("stream" + self.suffix, self.frame_hub.stats)
+            register_stats("metadata" + self.suffix, self.meta_hub.stats)
+
+        # Stage queues
+        self.capture_queue = register_queue(self.capture.queue)
+        self.render_queue = register_queue(LatestQueue("render" + self.suffix, maxsize=1))
+
+        # Loop variables
+        self.config_version = None
+        self.last_worker_eyes = []
+        self.last_other_eyes = []
+        self.relay_on = False
+        self.is_drowsy_alert = False
+        self.missing_frame_counter = 0
+        self.frame_seq = 0
+        self.frames_annotated = 0
+        self.frames_skipped = 0
+        # Set by offline replays that feed frames faster than real time (see clock())
+        self.replay_clock = False
+        # Metric children resolved once so the loops only bump counters
+        metric_camera = camera_id if camera_id is not None else "default"
+        self.frames_processed_metric = frames_total.labels(metric_camera, "processed")
+        self.frames_dropped_metric = frames_total.labels(metric_camera, "dropped")
+        self.alerts_metric = alerts_total.labels(metric_camera)
+        self.dropped_seen = 0
+        register_stats("render" + self.suffix, lambda: {"annotated": self.frames_annotated, "skipped": self.frames_skipped})
+
+        if not os.path.exists(YOLO_DATA_DIR): os.makedirs(YOLO_DATA_DIR)
+        if not os.path.exists(EYE_OPEN_DIR): os.makedirs(EYE_OPEN_DIR)
+        if not os.path.exists(EYE_CLOSED_DIR): os.makedirs(EYE_CLOSED_DIR)
+        self.last_data_save_time = 0
+
+    def current_config(self):
+        if self.camera_id is None:
+            return state.config_mgr.current()
+        return state.config_mgr.for_camera(self.camera_id)
+
+    def run(self):
+        self.capture.start()
+        workers = [threading.Thread(target=self.render_loop, name="render", daemon=True)]
+        for w in workers:
+            w.start()
 
-    YOLO_DATA_DIR = "data/raw_yolo"
-    EYE_OPEN_DIR = "data/raw_eyes/open"
-    EYE_CLOSED_DIR = "data/raw_eyes/closed"
-    if not os.path.exists(YOLO_DATA_DIR): os.makedirs(YOLO_DATA_DIR)
-    if not os.path.exists(EYE_OPEN_DIR): os.makedirs(EYE_OPEN_DIR)
-    if not os.path.exists(EYE_CLOSED_DIR): os.makedirs(EYE_CLOSED_DIR)
-    last_data_save_time = 0
-    
-    while not state.stop_event.is_set():
+        self.inference_loop()
 
-        current_conf = state.config_mgr.get("conf_threshold", 0.3)
-        current_drowsy_time = state.config_mgr.get("drowsy_time_threshold", 2.0)
-        logic_mode = int(state.config_mgr.get("eye_logic_mode", 0)) 
-        
-        if yolo.conf_thres != current_conf: yolo.conf_thres = current_conf
-        if tracker.drowsy_threshold != current_drowsy_time: tracker.drowsy_threshold = current_drowsy_time
+        for w in workers:
+            w.join(timeout=2.0)
 
-        ret, frame_orig = cap.read()
+        # Cleanup when loop ends
+        self.recorder.close()
+        self.capture.release()
+        set_relay(self.gpio_enabled, self.led_pin, self.logger, False)
 
-        recorder.update(frame_orig)
+    def clock(self, frame, live_time=None):
+        """
+        Time the detect scheduler, drowsiness timers and clip recorder run on: monotonic time (or
+        live_time) normally, the frame's position in its source with replay_clock set.
+        """
+        if self.replay_clock and frame.source_time is not None:
+            return frame.source_time
+        return time.monotonic() if live_time is None else live_time
 
-        if not ret or frame_orig is None or frame_orig.size == 0:
-            time.sleep(0.5)
-            continue
+    # ---------------- Stage 1: capture ----------------
+    def on_captured(self, frame):
+        # Decimated and JPEG-compressed inside the recorder, off the inference thread.
+        # While a clip is open the render stage feeds it annotated frames instead.
+        if not self.recorder.is_recording:
+            self.recorder.update(None if frame.jpeg else frame.image, jpeg=frame.jpeg, now=self.clock(frame, frame.captured_at))
+
+    # ---------------- Stage 2: detection + classification ----------------
+    def inference_loop(self):
+        while not state.stop_event.is_set():
+            frame = self.capture.get(timeout=1.0)
+            if frame is None:
+                # No frames means no update() calls; the clip still has to close on time
+                self.recorder.tick()
+                continue
+            STAGES["capture"].observe(time.monotonic() - frame.captured_at)
+            if self.capture.skipped != self.dropped_seen:
+                self.frames_dropped_metric.inc(self.capture.skipped - self.dropped_seen)
+                self.dropped_seen = self.capture.skipped
+            if self.models is not None:
+                # Lets the shared scheduler wait for this camera's requests before running a batch
+                self.models.begin_frame(self.camera_id)
+                try:
+                    job = self.process_frame(frame)
+                finally:
+                    self.models.end_frame(self.camera_id)
+            else:
+                job = self.process_frame(frame)
+            self.apply_relay()
+            self.frame_seq += 1
+            self.frames_processed_metric.inc()
+            if job["snapshot"]:
+                self.alerts_metric.inc()
+            # Overlay metadata goes out at inference rate, independent of how throttled the video is
+            if self.meta_hub.viewers:
+                self.meta_hub.publish(self.job_metadata(job))
+            self.render_queue.put(job)
+
+    def job_metadata(self, job):
+        h, w = job["frame"].shape[:2]
+        return json.dumps({
+            "seq": self.frame_seq,
+            "ts": int(time.time() * 1000),
+            "w": w,
+            "h": h,
+            "alert": bool(job["alert"]),
+            "crop": [int(v) for v in job["crop_rect"]] if job["crop_rect"] else None,
+            "eyes": [
+                {"box": [int(v) for v in box], "open": int(pred), "prob": round(float(prob), 3)}
+                for box, pred, prob in job["worker_eyes"]
+            ],
+            "ignored": [
+                {"box": [int(v) for v in box], "prob": None if prob is None else round(float(prob), 3)}
+                for box, prob in job["other_eyes"]
+            ],
+        }, separators=(",", ":")).encode()
+
+    def apply_config(self, cfg):
+        """Push a new config snapshot into the models and cache the values the hot loop needs."""
+        self.config_version = cfg.version
+        self.yolo.conf_thres = cfg.get("conf_threshold", 0.3)
+        self.yolo.iou_thres = cfg.get("iou_threshold", 0.35)
+        self.tracker.drowsy_threshold = cfg.get("drowsy_time_threshold", 2.0)
+        self.tracker.search_margin = cfg.get("tracking_search_margin", 0.5)
+        self.tracker.min_score = cfg.get("tracking_min_score", 0.6)
+        self.scheduler.configure(
+            cfg.get("detect_max_fps", 15),
+            cfg.get("detect_min_fps", 3),
+            cfg.get("detect_cpu_budget", 0.5),
+            cfg.get("detect_stable_iou", 0.8),
+        )
+        self.logic_mode = int(cfg.get("eye_logic_mode", 0))
+        self.eye_closed_thres = cfg.get("eye_closed_threshold", 0.8)
+        self.classify_ignored = bool(cfg.get("classify_ignored_eyes", False))
+        self.tracking_enabled = bool(cfg.get("tracking_enabled", True))
+        self.is_collecting = cfg.get("data_collection_enabled", False)
+        self.collection_interval = cfg.get("data_collection_interval", 10.0)
+        self.crop_settings = (
+            bool(cfg.get("crop_enabled", False)),
+            cfg.get("crop_x", 0), cfg.get("crop_y", 0), cfg.get("crop_w"), cfg.get("crop_h"),
+        )
+        self.crop_cache = None
+        self.recorder.preset = cfg.get("evidence_preset", "ultrafast")
+        self.recorder.crf = cfg.get("evidence_crf", 28)
+        self.recorder.post_seconds = cfg.get("evidence_post_seconds", 5)
+        self.recorder.max_clip_seconds = cfg.get("evidence_max_seconds", 60)
+
+    def crop_rect_for(self, h_img, w_img):
+        """Clamped (x, y, w, h) crop for this frame size, or None. Recomputed only when config or frame size changes."""
+        if self.crop_cache is not None and self.crop_cache[0] == (h_img, w_img):
+            return self.crop_cache[1]
+        crop_rect = None
+        crop_enabled, cx, cy, cw, ch = self.crop_settings
+        if crop_enabled:
+            cx, cy = int(cx), int(cy)
+            cw, ch = int(cw if cw is not None else w_img), int(ch if ch is not None else h_img)
+            cx, cy = max(0, min(cx, w_img - 1)), max(0, min(cy, h_img - 1))
+            cw, ch = max(state.MIN_CROP_SIZE, min(cw, w_img - cx)), max(state.MIN_CROP_SIZE, min(ch, h_img - cy))
+            if min(cw, w_img - cx) >= state.MIN_CROP_SIZE and min(ch, h_img - cy) >= state.MIN_CROP_SIZE:
+                crop_rect = (cx, cy, cw, ch)
+        self.crop_cache = ((h_img, w_img), crop_rect)
+        return crop_rect
+
+    def detect_boxes(self, frame, crop_rect):
+        """
+        YOLO boxes in full-frame coordinates. While no eyes are being followed (so nothing else needs
+        full-resolution pixels yet) YOLO runs on a reduced-scale decode of the camera JPEG.
+        """
+        factor = self.decode_scale if not self.last_worker_eyes else 1
+        det_frame = frame.reduced(factor)
+        f = frame.shape[1] / det_frame.shape[1]
+        if crop_rect is not None:
+            cx, cy, cw, ch = crop_rect
+            det_frame = det_frame[int(cy / f):int((cy + ch) / f), int(cx / f):int((cx + cw) / f)]
+        all_boxes = self.yolo.detect(det_frame)
+        if f != 1.0 and len(all_boxes):
+            all_boxes = np.round(all_boxes * f).astype(np.int32)
+        if crop_rect is not None and len(all_boxes):
+            all_boxes += (cx, cy, cx, cy)
+        return all_boxes
+
+    def process_frame(self, frame):
+        frame = CapturedFrame.wrap(frame)
+        cfg = self.current_config()
+        if cfg.version != self.config_version:
+            self.apply_config(cfg)
+        logic_mode = self.logic_mode
+
+        tracker, prob_history = self.tracker, self.prob_history
 
         should_save_data = False
         current_timestamp = int(time.time())
-        is_collecting = state.config_mgr.get("data_collection_enabled", False)
-        collection_interval = state.config_mgr.get("data_collection_interval", 10.0)
-        if is_collecting:
-            if time.time() - last_data_save_time >= collection_interval:
+        if self.is_collecting:
+            if time.time() - self.last_data_save_time >= self.collection_interval:
                 should_save_data = True
-                last_data_save_time = time.time()
-        
-        h_img, w_img = frame_orig.shape[:2]
-        crop_enabled = bool(state.config_mgr.get("crop_enabled", False))
-        
+                self.last_data_save_time = time.time()
+
+        h_img, w_img = frame.shape[:2]
+
         # Crop Logic
+        crop_rect = self.crop_rect_for(h_img, w_img)
+        crop_enabled = crop_rect is not None
         if crop_enabled:
-            cx, cy = int(state.config_mgr.get("crop_x", 0)), int(state.config_mgr.get("crop_y", 0))
-            cw, ch = int(state.config_mgr.get("crop_w", w_img)), int(state.config_mgr.get("crop_h", h_img))
-            cx, cy = max(0, min(cx, w_img - 1)), max(0, min(cy, h_img - 1))
-            cw, ch = max(state.MIN_CROP_SIZE, min(cw, w_img - cx)), max(state.MIN_CROP_SIZE, min(ch, h_img - cy))
-            proc_frame = frame_orig[cy:cy+ch, cx:cx+cw]
-            if proc_frame.size == 0 or proc_frame.shape[0] < state.MIN_CROP_SIZE or proc_frame.shape[1] < state.MIN_CROP_SIZE:
-                 proc_frame, crop_enabled = frame_orig, False
-        else:
-            proc_frame = frame_orig
-        
+            cx, cy, cw, ch = crop_rect
+
         if should_save_data:
             try:
-                yolo_fname = f"{YOLO_DATA_DIR}/{current_timestamp}.jpg"
+                proc_frame = frame.image[cy:cy+ch, cx:cx+cw] if crop_enabled else frame.image
+                yolo_fname = f"{YOLO_DATA_DIR}/{current_timestamp}{self.file_tag}.jpg"
                 cv2.imwrite(yolo_fname, proc_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
-                logger.info(f"Saved YOLO Frame: {yolo_fname}")
+                self.logger.info(f"Saved YOLO Frame: {yolo_fname}")
             except Exception as e:
-                logger.error(f"Save YOLO failed: {e}")
-
-        # Detection Logic (Skip Frames)
-        if frame_count % FRAME_SKIP == 0:
-            frame_count = 0
-            all_boxes = yolo.detect(proc_frame)
-            if crop_enabled and all_boxes:
-                for b in all_boxes:
-                    b[0] += cx; b[1] += cy; b[2] += cx; b[3] += cy
-            worker_eyes, other_eyes = tracker.filter_worker_eyes(all_boxes, frame_orig.shape, mode=logic_mode)
-            last_worker_eyes, last_other_eyes = worker_eyes, other_eyes
+                self.logger.error(f"Save YOLO failed: {e}")
+
+        # Detection Logic (Adaptive Schedule)
+        tracking_enabled = self.tracking_enabled
+        now = self.clock(frame)
+        if self.scheduler.should_detect(now, eyes_missing=len(self.last_worker_eyes) == 0):
+            start = time.monotonic()
+            all_boxes = self.detect_boxes(frame, crop_rect)
+            worker_eyes, other_eyes = tracker.filter_worker_eyes(all_boxes, frame.shape, mode=logic_mode)
+            self.scheduler.record(worker_eyes, time.monotonic() - start, now)
+            if tracking_enabled:
+                boxes = list(worker_eyes) + list(other_eyes)
+                # Templates need the full-resolution image; don't decode it for an empty scene
+                if boxes:
+                    tracker.sync(frame.image, boxes)
+                else:
+                    tracker.clear()
+        elif tracking_enabled and (self.last_worker_eyes or self.last_other_eyes):
+            # Follow head motion between detector runs so eye crops stay centred
+            start = time.perf_counter()
+            tracked = tracker.track(frame.image)
+            STAGES["track"].observe(time.perf_counter() - start)
+            n_worker = len(self.last_worker_eyes)
+            worker_eyes, other_eyes = tracked[:n_worker], tracked[n_worker:]
+            if tracker.lost_count or tracker.last_motion > 0.25:
+                self.scheduler.note_motion()
         else:
-            worker_eyes, other_eyes = last_worker_eyes, last_other_eyes
-            
-        display_frame = frame_orig
-        frame_count += 1
-        
+            worker_eyes, other_eyes = self.last_worker_eyes, self.last_other_eyes
+        self.last_worker_eyes, self.last_other_eyes = worker_eyes, other_eyes
+
         # Missing Frame Handling
         if len(worker_eyes) == 0:
             prob_history["left"].clear()
             prob_history["right"].clear()
-            missing_frame_counter += 1
-            if missing_frame_counter > MAX_MISSING_FRAMES:
+            self.missing_frame_counter += 1
+            if self.missing_frame_counter > self.MAX_MISSING_FRAMES:
                 tracker.reset()
-                is_drowsy_alert = False
-                missing_frame_counter = 0
+                self.is_drowsy_alert = False
+                self.missing_frame_counter = 0
         else:
-            missing_frame_counter = 0
-        
+            self.missing_frame_counter = 0
+
         # Eye Classification & Update Status
         eye_statuses = []
-        eye_closed_thres = state.config_mgr.get("eye_closed_threshold", 0.8)
-        
-        for i, box in enumerate(worker_eyes):
-            try:
-                x1, y1, x2, y2 = map(int, box)
-                y2 = y2 + int((y2 - y1) / 4)
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(display_frame.shape[1], x2), min(display_frame.shape[0], y2)
-                if x1 >= x2 or y1 >= y2: continue
-                eye_crop = display_frame[y1:y2, x1:x2]
-                if eye_crop.size == 0: continue
+        eye_results = []
+        other_results = []
+        eye_closed_thres = self.eye_closed_thres
+        classify_ignored = self.classify_ignored
+
+        # Crop every eye first so all of them go through one batched session.run
+        worker_crops = [(i, crop_eye(frame.image, box)) for i, box in enumerate(worker_eyes)]
+        worker_crops = [(i, c) for i, c in worker_crops if c is not None]
+        other_crops = [(box, crop_eye(frame.image, box)) for box in other_eyes] if classify_ignored else []
+        other_crops = [(box, c) for box, c in other_crops if c is not None]
 
+        batch = [eye_crop for _, (_, eye_crop) in worker_crops] + [eye_crop for _, (_, eye_crop) in other_crops]
+        try:
+            predictions = self.classifier.predict_batch(batch, thres=eye_closed_thres)
+        except Exception as e:
+            self.logger.error(f"Eye classification failed: {e}")
+            predictions, worker_crops, other_crops = [], [], []
 
-                _, prob_raw = classifier.predict(eye_crop, thres=eye_closed_thres)
-                
+        for (i, (rect, eye_crop)), (_, prob_raw) in zip(worker_crops, predictions):
+            try:
                 key = "left" if i == 0 else "right"
                 prob_history[key].append(prob_raw)
                 avg_prob = sum(prob_history[key]) / len(prob_history[key])
                 final_pred = 1 if avg_prob > eye_closed_thres else 0
 
                 if should_save_data:
-                    try:
-                        eye_side = "left" if i == 0 else "right"
-                        
-                        if final_pred == 1:
-                            target_dir = EYE_OPEN_DIR
-                            label_str = "open"
-                        else:
-                            target_dir = EYE_CLOSED_DIR
-                            label_str = "closed"
-
-                        eye_fname = f"{target_dir}/{current_timestamp}_{eye_side}_{label_str}.jpg"
-                        cv2.imwrite(eye_fname, eye_crop, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
-                    except Exception as e:
-                        logger.error(f"Save Eye failed: {e}")
-                
-                is_this_eye_drowsy = tracker.update_drowsiness(i, final_pred)
+                    self.save_eye_sample(eye_crop, i, final_pred, current_timestamp)
+
+                is_this_eye_drowsy = tracker.update_drowsiness(i, final_pred, now)
                 eye_statuses.append(is_this_eye_drowsy)
-                
-                label = "Open" if final_pred == 1 else "Closed"
-                display_frame = draw_hud_bbox(display_frame, (x1, y1), (x2, y2), pred=final_pred, label_text=label, prob=avg_prob)
+                eye_results.append((rect, final_pred, avg_prob))
             except: continue
 
+        for (box, _), (_, prob_raw) in zip(other_crops, predictions[len(worker_crops):]):
+            other_results.append((tuple(map(int, box)), prob_raw))
+
         # Alert Logic
         should_alert = False
         if all(eye_statuses):
             if (logic_mode == 0 and len(eye_statuses) == 2) or (logic_mode == 1 and len(eye_statuses) == 1):
                 should_alert = True
 
+        take_snapshot = False
         if should_alert:
-            if not is_drowsy_alert:
-                try: 
-                    save_suspected_frame(display_frame)
-                    recorder.save_evidence()
-                except: pass
-            is_drowsy_alert = True
-            cv2.putText(display_frame, "DROWSY!", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0,0,255), 3)
+            if not self.is_drowsy_alert:
+                take_snapshot = True
+            # Opens a clip on the first alert frame, then keeps extending it while the alert lasts
+            try: self.recorder.save_evidence(now)
+            except: pass
+            self.is_drowsy_alert = True
         else:
-            is_drowsy_alert = False
-            
-        for box in other_eyes:
-            x1, y1, x2, y2 = map(int, box)
-            display_frame = draw_hud_bbox(display_frame, (x1, y1), (x2, y2), pred=None, label_text="Ignored", color_override=(192,192,192))
+            self.is_drowsy_alert = False
+
+        job = {
+            "frame": frame,
+            "worker_eyes": eye_results,
+            "other_eyes": other_results if classify_ignored else [(tuple(map(int, box)), None) for box in other_eyes],
+            "alert": self.is_drowsy_alert,
+            "crop_rect": crop_rect,
+            "snapshot": take_snapshot,
+        }
+        if take_snapshot:
+            # Saved here rather than in the render stage: the render queue drops stale jobs, and the
+            # snapshot (what the history page lists) is only taken on the first alert frame
+            self.save_snapshot(job)
+        return job
+
+    def save_eye_sample(self, eye_crop, eye_index, final_pred, current_timestamp):
+        try:
+            eye_side = "left" if eye_index == 0 else "right"
 
+            if final_pred == 1:
+                target_dir = EYE_OPEN_DIR
+                label_str = "open"
+            else:
+                target_dir = EYE_CLOSED_DIR
+                label_str = "closed"
+
+            eye_fname = f"{target_dir}/{current_timestamp}_{eye_side}_{label_str}{self.file_tag}.jpg"
+            cv2.imwrite(eye_fname, eye_crop, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
+        except Exception as e:
+            self.logger.error(f"Save Eye failed: {e}")
+
+    def apply_relay(self):
         # Relay Control
-        if is_drowsy_alert and not relay_on:
-            set_relay(gpio_enabled, led_pin, logger, True)
-            relay_on = True
-        elif not is_drowsy_alert and relay_on:
-            set_relay(gpio_enabled, led_pin, logger, False)
-            relay_on = False
+        if self.is_drowsy_alert and not self.relay_on:
+            set_relay(self.gpio_enabled, self.led_pin, self.logger, True)
+            self.relay_on = True
+        elif not self.is_drowsy_alert and self.relay_on:
+            set_relay(self.gpio_enabled, self.led_pin, self.logger, False)
+            self.relay_on = False
+
+    # ---------------- Stage 3: annotate + encode ----------------
+    def render_loop(self):
+        while not state.stop_event.is_set():
+            job = self.render_queue.get(timeout=1.0)
+            if job is not None:
+                self.render_job(job)
+
+    def render_job(self, job):
+        # JPEG encoding is only paid for while someone watches; overlays only for saved evidence
+        now = self.clock(job["frame"])
+        has_viewers = self.frame_hub.viewers > 0
+        for_clip = self.recorder.is_recording and self.recorder.wants_frame(now)
+        if not (has_viewers or for_clip):
+            self.frames_skipped += 1
+            return
+
+        # Viewers get the clean frame; the dashboard draws boxes from the metadata stream
+        for variant in self.frame_hub.active_variants():
+            jpeg = self.encode_variant(job["frame"], variant)
+            if jpeg is not None:
+                self.frame_hub.publish(jpeg, variant)
+
+        if not for_clip:
+            return
+        start = time.perf_counter()
+        display_frame = self.annotate(job)
+        STAGES["draw"].observe(time.perf_counter() - start)
+        self.frames_annotated += 1
+        self.recorder.update(display_frame, now=now)
+
+    def save_snapshot(self, job):
+        # Draw on a copy: the render thread may annotate the same frame for the clip
+        try: save_suspected_frame(self.annotate(job, job["frame"].image.copy()), tag=self.camera_id)
+        except: pass
+
+    def encode_variant(self, frame, variant):
+        scale, quality = variant
+        # The default variant is the camera's own JPEG when we have it
+        if frame.jpeg is not None and variant == FrameHub.DEFAULT_VARIANT:
+            return frame.jpeg
+        start = time.perf_counter()
+        h, w = frame.shape[:2]
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        display_frame = frame.reduced(2) if scale <= 0.5 else frame.image
+        if (display_frame.shape[1], display_frame.shape[0]) != size:
+            display_frame = cv2.resize(display_frame, size, interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', display_frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        STAGES["encode"].observe(time.perf_counter() - start)
+        return buffer.tobytes() if ret else None
+
+    def annotate(self, job, display_frame=None):
+        if display_frame is None:
+            display_frame = job["frame"].image
 
-        if crop_enabled: cv2.rectangle(display_frame, (cx, cy), (cx+cw, cy+ch), (0, 255, 255), 2)
+        for (x1, y1, x2, y2), final_pred, avg_prob in job["worker_eyes"]:
+            label = "Open" if final_pred == 1 else "Closed"
+            display_frame = draw_hud_bbox(display_frame, (x1, y1), (x2, y2), pred=final_pred, label_text=label, prob=avg_prob)
+
+        if job["alert"]:
+            cv2.putText(display_frame, "DROWSY!", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0,0,255), 3)
+
+        for (x1, y1, x2, y2), prob in job["other_eyes"]:
+            display_frame = draw_hud_bbox(display_frame, (x1, y1), (x2, y2), pred=None, label_text="Ignored", color_override=(192,192,192), prob=prob)
+
+        if job["crop_rect"]:
+            cx, cy, cw, ch = job["crop_rect"]
+            cv2.rectangle(display_frame, (cx, cy), (cx+cw, cy+ch), (0, 255, 255), 2)
 
         # Draw Timestamp
         dt_string = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         height = display_frame.shape[0]
-        position = (10, height - 20) 
+        position = (10, height - 20)
         cv2.putText(display_frame, dt_string, position, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 3, cv2.LINE_AA)
         cv2.putText(display_frame, dt_string, position, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 1, cv2.LINE_AA)
+        return display_frame
+
+
+def crop_eye(frame, box):
+    x1, y1, x2, y2 = map(int, box)
+    y2 = y2 + int((y2 - y1) / 4)
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(frame.shape[1], x2), min(frame.shape[0], y2)
+    if x1 >= x2 or y1 >= y2: return None
+    eye_crop = frame[y1:y2, x1:x2]
+    if eye_crop.size == 0: return None
+    return (x1, y1, x2, y2), eye_crop
+
+
+def load_models(cfg):
+    yolo = YOLOModel(
+        cfg.get("yolo_path", "weights/new-best.onnx"),
+        input_size=cfg.get("yolo_img_size", 224),
+        conf_thres=cfg.get("conf_threshold", 0.3),
+        iou_thres=cfg.get("iou_threshold", 0.35),
+        session_options=cfg.get("yolo_session")
+    )
+    classifier = EyeClassifier(
+        cfg.get("eye_model_path", "weights/eye_model.onnx"),
+        input_size=cfg.get("eye_img_size"),
+        session_options=cfg.get("eye_session")
+    )
+    return yolo, classifier
+
+
+def model_report(yolo, classifier):
+    return {
+        "yolo": dict(yolo.session_settings, warmup_ms=round(yolo.warmup_ms, 1), batched=yolo.supports_batch),
+        "eye": dict(classifier.session_settings, warmup_ms=round(classifier.warmup_ms, 1),
+                    batched=classifier.supports_batch),
+    }
+
 
-        # Update Global Frame
-        ret, buffer = cv2.imencode('.jpg', display_frame, encode_params)
-        if ret:
-            with state.frame_lock:
-                state.latest_jpeg_frame = buffer.tobytes()
-                state.new_frame_event.set()
+def run_detection_thread(logger):
+    camera_ids = state.config_mgr.camera_ids()
+    if not camera_ids:
+        DetectionPipeline(logger).run()
+        return
+    # Ids end up in URLs, directory and file names
+    if len(set(camera_ids)) != len(camera_ids) or not all(re.fullmatch(r"[\w-]+", c) for c in camera_ids):
+        logger.error(f"Camera ids must be unique and use only letters, digits, '_' or '-': {camera_ids}")
+        return
+
+    # Several cameras: one set of ONNX sessions and one evidence encoder for all of them
+    cfg = state.config_mgr.current()
+    yolo, classifier = load_models(cfg)
+    report = model_report(yolo, classifier)
+    for name, values in report.items():
+        logger.info(f"ONNX session [{name}]: " + ", ".join(f"{k}={v}" for k, v in values.items()))
+    register_stats("models", lambda: report)
+    models = InferenceScheduler(
+        yolo, classifier,
+        batch_window_ms=cfg.get("inference_batch_window_ms", 2),
+        stop_event=state.stop_event
+    ).start()
+    register_stats("inference", models.stats)
+
+    encode_queue = EncodeQueue(
+        "logs/videos/encode_journal.json",
+        workers=cfg.get("evidence_encode_workers", 1)
+    )
+    encode_queue.recover(["logs/videos"] + [os.path.join("logs/videos", camera_id) for camera_id in camera_ids])
+    register_stats("encode_queue", encode_queue.stats)
 
-    # Cleanup when loop ends
-    cap.release()
-    set_relay(gpio_enabled, led_pin, logger, False)
\ No newline at end of file
+    pipelines = [DetectionPipeline(logger, camera_id, models=models, encode_queue=encode_queue) for camera_id in camera_ids]
+    logger.info(f"Running {len(pipelines)} cameras: {', '.join(camera_ids)}")
+    threads = [threading.Thread(target=p.run, name=f"camera{p.suffix}", daemon=True) for p in pipelines[1:]]
+    for t in threads:
+        t.start()
+    try:
+        pipelines[0].run()
+        for t in threads:
+            t.join(timeout=5.0)
+    finally:
+        # A camera thread still stuck after the join must not leave its relay on
+        for p in pipelines:
+            set_relay(p.gpio_enabled, p.led_pin, logger, False)
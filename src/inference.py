@@ -0,0 +1,188 @@
+import threading
+import time
+import numpy as np
+
+
+class InferenceRequest:
+    __slots__ = ("camera_id", "kind", "payload", "thres", "iou_thres", "result", "error", "done")
+
+    def __init__(self, camera_id, kind, payload, thres, iou_thres=None):
+        self.camera_id = camera_id
+        self.kind = kind
+        self.payload = payload
+        self.thres = thres
+        self.iou_thres = iou_thres
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceScheduler:
+    """
+    One YOLO and one eye-classifier session shared by several camera pipelines.
+
+    Camera threads call detect() / classify() and block. A single worker thread takes every
+    pending request and serves all cameras with one YOLO call (a real batch when the export
+    allows it) and one classifier call. Once the first request arrives it waits, at most
+    batch_window_ms, for the other cameras that are in the middle of a frame to submit theirs.
+    """
+
+    KINDS = ("detect", "classify")
+
+    def __init__(self, yolo, classifier, batch_window_ms=2.0, stop_event=None):
+        self.yolo = yolo
+        self.classifier = classifier
+        self.batch_window = max(0.0, float(batch_window_ms)) / 1000
+        self.stop_event = stop_event or threading.Event()
+        self.cond = threading.Condition()
+        self.pending = []
+        self.in_frame = set()
+        self.thread = None
+
+        self.calls = dict.fromkeys(self.KINDS, 0)
+        self.requests = dict.fromkeys(self.KINDS, 0)
+        self.items = dict.fromkeys(self.KINDS, 0)
+        self.max_batch = dict.fromkeys(self.KINDS, 0)
+        self.run_ms = dict.fromkeys(self.KINDS, 0.0)
+        self.wait_ms = 0.0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="inference", daemon=True)
+            self.thread.start()
+        return self
+
+    # ---------------- camera side ----------------
+    def begin_frame(self, camera_id):
+        with self.cond:
+            self.in_frame.add(camera_id)
+
+    def end_frame(self, camera_id):
+        with self.cond:
+            self.in_frame.discard(camera_id)
+            # The worker may be holding a batch open for this camera
+            self.cond.notify_all()
+
+    def detect(self, camera_id, image, conf_thres=None, iou_thres=None):
+        boxes = self._submit(InferenceRequest(camera_id, "detect", image, conf_thres, iou_thres))
+        return boxes if boxes is not None else np.empty((0, 4), dtype=np.int32)
+
+    def classify(self, camera_id, crops, thres=0.7):
+        if not crops:
+            return []
+        return self._submit(InferenceRequest(camera_id, "classify", list(crops), thres)) or []
+
+    def _submit(self, request):
+        with self.cond:
+            self.pending.append(request)
+            self.cond.notify_all()
+        while not request.done.wait(0.5):
+            if self.stop_event.is_set():
+                return None
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    # ---------------- worker side ----------------
+    def _take_batch(self):
+        with self.cond:
+            while not self.pending:
+                if self.stop_event.is_set():
+                    return []
+                self.cond.wait(0.5)
+            first = time.monotonic()
+            deadline = first + self.batch_window
+            while True:
+                waiting = {r.camera_id for r in self.pending}
+                remaining = deadline - time.monotonic()
+                if self.in_frame <= waiting or remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch, self.pending = self.pending, []
+        wait = (time.monotonic() - first) * 1000
+        self.wait_ms = wait if self.wait_ms == 0.0 else 0.9 * self.wait_ms + 0.1 * wait
+        return batch
+
+    def run(self):
+        while not self.stop_event.is_set():
+            batch = self._take_batch()
+            for kind in self.KINDS:
+                requests = [r for r in batch if r.kind == kind]
+                if requests:
+                    self._serve(kind, requests)
+
+    def _serve(self, kind, requests):
+        start = time.perf_counter()
+        items = 0
+        try:
+            if kind == "detect":
+                results = self.yolo.detect_batch([r.payload for r in requests], [r.thres for r in requests],
+                                                 [r.iou_thres for r in requests])
+                items = len(requests)
+            else:
+                crops = [crop for r in requests for crop in r.payload]
+                probs = [prob for _, prob in self.classifier.predict_batch(crops)]
+                results, offset = [], 0
+                for r in requests:
+                    chunk = probs[offset:offset + len(r.payload)]
+                    offset += len(r.payload)
+                    results.append([(int(p > r.thres), p) for p in chunk])
+                items = len(crops)
+            for r, result in zip(requests, results):
+                r.result = result
+        except Exception as e:
+            for r in requests:
+                r.error = e
+        finally:
+            for r in requests:
+                r.done.set()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.calls[kind] += 1
+        self.requests[kind] += len(requests)
+        self.items[kind] += items
+        self.max_batch[kind] = max(self.max_batch[kind], len(requests))
+        self.run_ms[kind] = elapsed if self.calls[kind] == 1 else 0.9 * self.run_ms[kind] + 0.1 * elapsed
+
+    def stats(self):
+        return {
+            "batch_window_ms": round(self.batch_window * 1000, 2),
+            "wait_ms": round(self.wait_ms, 2),
+            "yolo_batched": self.yolo.supports_batch,
+            "eye_batched": self.classifier.supports_batch,
+            **{
+                kind: {
+                    "calls": self.calls[kind],
+                    "requests": self.requests[kind],
+                    "items": self.items[kind],
+                    "avg_requests": round(self.requests[kind] / self.calls[kind], 2) if self.calls[kind] else 0.0,
+                    "max_requests": self.max_batch[kind],
+                    "run_ms": round(self.run_ms[kind], 2),
+                }
+                for kind in self.KINDS
+            },
+        }
+
+
+class SharedDetector:
+    """Per-camera stand-in for YOLOModel that sends detect() through the InferenceScheduler."""
+
+    def __init__(self, scheduler, camera_id, conf_thres=0.3, iou_thres=0.35):
+        self.scheduler = scheduler
+        self.camera_id = camera_id
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+
+    def detect(self, frame):
+        return self.scheduler.detect(self.camera_id, frame, self.conf_thres, self.iou_thres)
+
+
+class SharedClassifier:
+    """Per-camera stand-in for EyeClassifier that sends predict_batch() through the InferenceScheduler."""
+
+    def __init__(self, scheduler, camera_id):
+        self.scheduler = scheduler
+        self.camera_id = camera_id
+
+    def predict_batch(self, eye_imgs, thres=0.7):
+        return self.scheduler.classify(self.camera_id, eye_imgs, thres)
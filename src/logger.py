@@ -47,19 +47,21 @@ def create_log(log_file: str = "./logs/log_app/app.log", backup_days: int = 30)
 
     return logger
  
-def save_suspected_frame(frame, save_dir="./logs/log_frame"):
+def save_suspected_frame(frame, save_dir="./logs/log_frame", tag=None):
     """
     Save the current frame as an image file in the specified directory.
     
     Args:
         frame: Image frame to save
         save_dir: Directory to save the image file
+        tag: Camera id appended to the file name when several cameras are configured
     """
     os.makedirs(save_dir, exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
     # file_path_origin = os.path.join(save_dir, f"suspected_origin_{timestamp}.jpg")
-    file_path_annotated = os.path.join(save_dir, f"suspected_annotated_{timestamp}.jpg")
+    suffix = f"_{tag}" if tag is not None else ""
+    file_path_annotated = os.path.join(save_dir, f"suspected_annotated_{timestamp}{suffix}.jpg")
     
     # origin_frame = cv2.cvtColor(origin_frame, cv2.COLOR_RGB2BGR)
     # annotated_frame = cv2.cvtColor(annotated_frame, cv2.COLOR_RGB2BGR)
@@ -0,0 +1,238 @@
+"""
+Prometheus text-format metrics for /metrics.
+
+Hot-loop instrumentation is preaggregated: a histogram is a fixed list of bucket counters plus a
+sum and a count, and label children are created once (resolve them with .labels() at setup, not
+per frame), so observe()/inc() only do a bisect and a few integer updates under the child's own
+lock (stages like "nms" are observed from several camera threads). Gauges that are cheap
+to read on demand (viewers, CPU, RSS) are computed at scrape time instead of being updated.
+"""
+import os
+import threading
+from bisect import bisect_left
+
+import psutil
+
+import global_state as state
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0)
+ENCODE_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Bucket counts, sum and count from the same instant."""
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        """Child series for these label values. Call once at setup and keep the result."""
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = self.header()
+        for key, child in list(self.children.items()):
+            counts, total, observed = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {observed}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render(self):
+        lines = self.header()
+        for key, child in list(self.children.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(child.value)}")
+        return lines
+
+
+class Gauge(Metric):
+    """Read at scrape time: `collect` returns [(label values, value)]."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, collect, labelnames=(), kind="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = self.header()
+        for key, value in self.collect():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        if not metric.labelnames and not isinstance(metric, Gauge):
+            # Unlabelled series are exported as zero before the first update
+            metric.labels()
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, buckets=STAGE_BUCKETS, labelnames=()):
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, collect, labelnames=(), kind="gauge"):
+        return self.register(Gauge(name, documentation, collect, labelnames, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "qaeye_stage_seconds",
+    "Time per frame spent in each pipeline stage (capture is frame age when inference picks it up)",
+    STAGE_BUCKETS, ("stage",),
+)
+frames_total = registry.counter("qaeye_frames_total", "Camera frames by outcome (processed or dropped before inference)", ("camera", "outcome"))
+alerts_total = registry.counter("qaeye_alerts_total", "Drowsiness alerts fired", ("camera",))
+evidence_encode_seconds = registry.histogram("qaeye_evidence_encode_seconds", "Evidence clip encode duration", ENCODE_BUCKETS)
+evidence_encodes_total = registry.counter("qaeye_evidence_encodes_total", "Evidence clip encodes by result", ("result",))
+sync_files_total = registry.counter("qaeye_sync_files_total", "Dataset files uploaded by sync, by result", ("result",))
+sync_bytes_total = registry.counter("qaeye_sync_bytes_total", "Dataset bytes uploaded by sync")
+sync_seconds_total = registry.counter("qaeye_sync_seconds_total", "Time spent in dataset sync")
+
+# Resolved once; the hot loop calls .observe() on these directly
+STAGES = {
+    name: stage_seconds.labels(name)
+    for name in ("capture", "preprocess", "yolo", "nms", "track", "classify", "draw", "encode")
+}
+
+_process = psutil.Process(os.getpid())
+
+
+def _viewers():
+    hubs = state.frame_hubs or {"default": state.frame_hub}
+    meta_hubs = state.meta_hubs or {"default": state.meta_hub}
+    samples = [((camera, "video"), hub.viewers) for camera, hub in hubs.items()]
+    samples += [((camera, "metadata"), hub.viewers) for camera, hub in meta_hubs.items()]
+    return samples
+
+
+def _cpu():
+    times = _process.cpu_times()
+    return [(("user",), times.user), (("system",), times.system)]
+
+
+registry.gauge("qaeye_stream_viewers", "Connected stream viewers", _viewers, ("camera", "stream"))
+registry.gauge("process_cpu_seconds_total", "Process CPU time by mode", _cpu, ("mode",), kind="counter")
+registry.gauge("process_resident_memory_bytes", "Resident set size", lambda: [((), _process.memory_info().rss)])
+registry.gauge("process_threads", "Threads in the process", lambda: [((), _process.num_threads())])
+registry.gauge("process_start_time_seconds", "Process start time (unix seconds)", lambda: [((), _process.create_time())])
+
+
+def render_metrics():
+    return registry.render()
@@ -3,6 +3,7 @@ import cv2
 import numpy as np
 import onnxruntime as ort
 from src.utils import softmax
+from src.metrics import STAGES
 import os
 import time
 
@@ -13,101 +14,338 @@ def save_img_bgr(img_bgr, save_dir="debug_imgs"):
     cv2.imwrite(save_path, img_bgr)
     return save_path
 
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def make_session(model_path, options=None, defaults=None):
+    """
+    CPU InferenceSession from a plain dict of tuning options (see yolo_session / eye_session in
+    configs.yaml). Unset keys fall back to `defaults`, then to ONNX Runtime's own defaults.
+    Returns the session and the effective settings.
+    """
+    settings = dict(defaults or {})
+    settings.update({k: v for k, v in (options or {}).items() if v is not None})
+
+    sess_options = ort.SessionOptions()
+    if "intra_op_num_threads" in settings:
+        sess_options.intra_op_num_threads = int(settings["intra_op_num_threads"])
+    if "inter_op_num_threads" in settings:
+        sess_options.inter_op_num_threads = int(settings["inter_op_num_threads"])
+    if "execution_mode" in settings:
+        sess_options.execution_mode = EXECUTION_MODES[str(settings["execution_mode"]).lower()]
+    if "graph_optimization_level" in settings:
+        sess_options.graph_optimization_level = OPTIMIZATION_LEVELS[str(settings["graph_optimization_level"]).lower()]
+    if "enable_cpu_mem_arena" in settings:
+        sess_options.enable_cpu_mem_arena = bool(settings["enable_cpu_mem_arena"])
+    if "enable_mem_pattern" in settings:
+        sess_options.enable_mem_pattern = bool(settings["enable_mem_pattern"])
+    if "allow_spinning" in settings:
+        # Busy-waiting worker threads burn cores that ffmpeg and the UI need
+        spin = "1" if settings["allow_spinning"] else "0"
+        sess_options.add_session_config_entry("session.intra_op.allow_spinning", spin)
+        sess_options.add_session_config_entry("session.inter_op.allow_spinning", spin)
+
+    session = ort.InferenceSession(model_path, sess_options, providers=['CPUExecutionProvider'])
+    effective = {
+        "intra_op_num_threads": sess_options.intra_op_num_threads,
+        "inter_op_num_threads": sess_options.inter_op_num_threads,
+        "execution_mode": str(sess_options.execution_mode).split(".")[-1],
+        "graph_optimization_level": str(sess_options.graph_optimization_level).split(".")[-1],
+        "enable_cpu_mem_arena": sess_options.enable_cpu_mem_arena,
+        "enable_mem_pattern": sess_options.enable_mem_pattern,
+        "allow_spinning": settings.get("allow_spinning", True),
+    }
+    return session, effective
+
+
+def bind_io(session, input_view, output_view):
+    """
+    Bind preallocated CPU buffers as the input and output of a session, so run_with_iobinding
+    reads and writes them in place. Returns None if the session can't be bound this way.
+    """
+    try:
+        binding = session.io_binding()
+        binding.bind_cpu_input(session.get_inputs()[0].name, input_view)
+        binding.bind_output(
+            session.get_outputs()[0].name, 'cpu', 0,
+            output_view.dtype, list(output_view.shape), output_view.ctypes.data
+        )
+        return binding
+    except Exception:
+        return None
+
+
+def run_bound(session, binding, input_view, output_view):
+    if binding is not None:
+        session.run_with_iobinding(binding)
+        return output_view
+    return session.run(None, {session.get_inputs()[0].name: input_view})[0]
+
+
+def probe_batch_support(session, sample_shape):
+    """True if the session really runs a batch of 2 (some exports declare a dynamic batch dim but reshape to 1 internally)."""
+    batch_dim = session.get_inputs()[0].shape[0]
+    if isinstance(batch_dim, int):
+        return batch_dim != 1
+    run_options = ort.RunOptions()
+    run_options.log_severity_level = 4
+    probe = np.zeros((2,) + tuple(sample_shape), dtype=np.float32)
+    try:
+        outputs = session.run(None, {session.get_inputs()[0].name: probe}, run_options)
+        return outputs[0].shape[0] == 2
+    except Exception:
+        return False
+
+
 class YOLOModel:
-    def __init__(self, model_path, input_size=224, conf_thres=0.3, iou_thres=0.35):
-        sess_options = ort.SessionOptions()
-        sess_options.intra_op_num_threads = 2 
-        sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-        
-        self.session = ort.InferenceSession(model_path, sess_options, providers=['CPUExecutionProvider'])
+    SESSION_DEFAULTS = {
+        "intra_op_num_threads": 2,
+        "execution_mode": "sequential",
+        "graph_optimization_level": "all",
+    }
+
+    def __init__(self, model_path, input_size=224, conf_thres=0.3, iou_thres=0.35, session_options=None):
+        self.session, self.session_settings = make_session(model_path, session_options, self.SESSION_DEFAULTS)
         self.input_name = self.session.get_inputs()[0].name
         self.input_size = input_size
         self.conf_thres = conf_thres
         self.iou_thres = iou_thres
 
+        # Reusable buffers: planar RGB uint8 letterbox, network input, network output
+        self._lut = np.arange(256, dtype=np.float32) / 255.0
+        self._planar = np.full((3, input_size, input_size), 114, dtype=np.uint8)
+        self._input = np.zeros((1, 3, input_size, input_size), dtype=np.float32)
+        # Letterbox layout and resize buffer per input size (cameras or crops of different sizes)
+        self._layouts = {}
+        self._planar_size = None
+        start = time.perf_counter()
+        self._output = np.empty_like(self.session.run(None, {self.input_name: self._input})[0])
+        self.warmup_ms = (time.perf_counter() - start) * 1000
+        self._binding = bind_io(self.session, self._input, self._output)
+        self.supports_batch = probe_batch_support(self.session, (3, input_size, input_size))
+        self._batch_input = None
+
+    def _letterbox_layout(self, h, w):
+        layout = self._layouts.get((h, w))
+        if layout is None:
+            if len(self._layouts) >= 8:
+                # Crop changes produce new sizes; don't keep buffers for all of them
+                self._layouts.clear()
+            scale = min(self.input_size / h, self.input_size / w)
+            nw, nh = int(w * scale), int(h * scale)
+            dw, dh = (self.input_size - nw) // 2, (self.input_size - nh) // 2
+            layout = self._layouts[(h, w)] = (scale, nw, nh, dw, dh, np.empty((nh, nw, 3), dtype=np.uint8))
+        if self._planar_size != (h, w):
+            self._planar.fill(114)
+            self._planar_size = (h, w)
+        return layout
+
+    def _fill(self, dst, img_bgr):
+        """Letterbox one image into a (3, s, s) float32 slot. Returns (scale, pad)."""
+        h, w = img_bgr.shape[:2]
+        scale, nw, nh, dw, dh, resized = self._letterbox_layout(h, w)
+        cv2.resize(img_bgr, (nw, nh), dst=resized)
+        # HWC BGR -> CHW RGB straight into the padded planes
+        self._planar[:, dh:nh+dh, dw:nw+dw] = resized.transpose(2, 0, 1)[::-1]
+        s = self.input_size
+        cv2.LUT(self._planar.reshape(3 * s, s), self._lut, dst=dst.reshape(3 * s, s))
+        return scale, (dw, dh)
+
     def preprocess(self, img_bgr):
-        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)  
-        h, w = img_rgb.shape[:2]
-        scale = min(self.input_size / h, self.input_size / w)
-        nw, nh = int(w * scale), int(h * scale)
-        img_resized = cv2.resize(img_rgb, (nw, nh))
-        image_padded = np.full((self.input_size, self.input_size, 3), 114, dtype=np.uint8)
-        dw, dh = (self.input_size - nw) // 2, (self.input_size - nh) // 2
-        image_padded[dh:nh+dh, dw:nw+dw] = img_resized
-        img_input = image_padded.astype(np.float32) / 255.0
-        img_input = img_input.transpose(2, 0, 1)
-        img_input = np.expand_dims(img_input, 0)
-        return img_input, scale, (dw, dh)
-
-    def detect(self, frame):
-        input_tensor, scale, (pad_w, pad_h) = self.preprocess(frame)
-        outputs = self.session.run(None, {self.input_name: input_tensor})
-        preds = outputs[0][0].transpose()
-        boxes_temp, scores_temp = [], []
-        for row in preds:
-            classes_scores = row[4:]
-            max_score = np.amax(classes_scores)
-            if max_score >= self.conf_thres:
-                cx, cy, w, h = row[:4]
-                x = int(cx - w / 2)
-                y = int(cy - h / 2)
-                boxes_temp.append([x, y, int(w), int(h)])
-                scores_temp.append(float(max_score))
-        indices = cv2.dnn.NMSBoxes(boxes_temp, scores_temp, self.conf_thres, self.iou_thres)
-        final_boxes = []
-        if len(indices) > 0:
-            frame_h, frame_w = frame.shape[:2]
-            for i in indices.flatten():
-                bx, by, bw, bh = boxes_temp[i]
-                real_x1 = max(0, int((bx - pad_w) / scale))
-                real_y1 = max(0, int((by - pad_h) / scale))
-                real_x2 = min(frame_w, real_x1 + int(bw / scale))
-                real_y2 = min(frame_h, real_y1 + int(bh / scale))
-                final_boxes.append([real_x1, real_y1, real_x2, real_y2])
-        return final_boxes
+        scale, pad = self._fill(self._input[0], img_bgr)
+        return self._input, scale, pad
+
+    def detect(self, frame, conf_thres=None, iou_thres=None):
+        t0 = time.perf_counter()
+        input_tensor, scale, pad = self.preprocess(frame)
+        t1 = time.perf_counter()
+        output = run_bound(self.session, self._binding, input_tensor, self._output)
+        t2 = time.perf_counter()
+        boxes = self.decode(output[0], scale, pad, frame.shape[:2], conf_thres, iou_thres)
+        STAGES["preprocess"].observe(t1 - t0)
+        STAGES["yolo"].observe(t2 - t1)
+        STAGES["nms"].observe(time.perf_counter() - t2)
+        return boxes
+
+    def detect_batch(self, frames, conf_thres=None, iou_thres=None):
+        """
+        detect() for several frames. One session.run over the whole batch when the export has a
+        usable batch dimension, otherwise one call per frame. conf_thres and iou_thres may be one
+        value per frame.
+        """
+        n = len(frames)
+        confs = conf_thres if isinstance(conf_thres, (list, tuple)) else [conf_thres] * n
+        ious = iou_thres if isinstance(iou_thres, (list, tuple)) else [iou_thres] * n
+        if n < 2 or not self.supports_batch:
+            return [self.detect(frame, conf, iou) for frame, conf, iou in zip(frames, confs, ious)]
+
+        if self._batch_input is None or self._batch_input.shape[0] < n:
+            s = self.input_size
+            self._batch_input = np.zeros((n, 3, s, s), dtype=np.float32)
+        t0 = time.perf_counter()
+        layouts = [self._fill(self._batch_input[i], frame) for i, frame in enumerate(frames)]
+        t1 = time.perf_counter()
+        outputs = self.session.run(None, {self.input_name: self._batch_input[:n]})[0]
+        t2 = time.perf_counter()
+        results = [
+            self.decode(outputs[i], scale, pad, frame.shape[:2], conf, iou)
+            for i, (frame, (scale, pad), conf, iou) in enumerate(zip(frames, layouts, confs, ious))
+        ]
+        # Per-batch timings: one sample per session.run, like the unbatched path
+        STAGES["preprocess"].observe(t1 - t0)
+        STAGES["yolo"].observe(t2 - t1)
+        STAGES["nms"].observe(time.perf_counter() - t2)
+        return results
+
+    def decode(self, output, scale, pad, frame_hw, conf_thres=None, iou_thres=None):
+        """
+        Turn one raw YOLO output (4 + num_classes, num_anchors) into an (N, 4) int array of
+        x1, y1, x2, y2 boxes in frame coordinates. Same results as the old per-row loop + cv2.dnn.NMSBoxes.
+        """
+        scores = output[4:].max(axis=0)
+        # NMSBoxes keeps scores strictly above the threshold
+        keep = scores > (self.conf_thres if conf_thres is None else conf_thres)
+        if not keep.any():
+            return np.empty((0, 4), dtype=np.int32)
+
+        cx, cy, w, h = output[:4, keep]
+        scores = scores[keep]
+        xywh = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1).astype(np.int32)
+
+        xywh = xywh[nms(xywh, scores, self.iou_thres if iou_thres is None else iou_thres)]
+
+        pad_w, pad_h = pad
+        frame_h, frame_w = frame_hw
+        boxes = np.empty_like(xywh)
+        boxes[:, 0] = ((xywh[:, 0] - pad_w) / scale).astype(np.int32)
+        boxes[:, 1] = ((xywh[:, 1] - pad_h) / scale).astype(np.int32)
+        np.maximum(boxes[:, :2], 0, out=boxes[:, :2])
+        boxes[:, 2] = boxes[:, 0] + (xywh[:, 2] / scale).astype(np.int32)
+        boxes[:, 3] = boxes[:, 1] + (xywh[:, 3] / scale).astype(np.int32)
+        np.minimum(boxes[:, 2], frame_w, out=boxes[:, 2])
+        np.minimum(boxes[:, 3], frame_h, out=boxes[:, 3])
+        return boxes
+
+
+def nms(xywh, scores, iou_thres):
+    """Greedy NMS over (N, 4) x, y, w, h boxes. Returns kept indices, highest score first."""
+    x1, y1 = xywh[:, 0], xywh[:, 1]
+    x2, y2 = x1 + xywh[:, 2], y1 + xywh[:, 3]
+    areas = xywh[:, 2].astype(np.float64) * xywh[:, 3]
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = inter_w.astype(np.float64) * inter_h
+        union = areas[i] + areas[rest] - inter
+        iou = np.divide(inter, union, out=np.ones_like(inter), where=union > 0)
+        # Round the way OpenCV's rectOverlap does (1 - float(jaccard distance)) so borderline boxes match NMSBoxes
+        iou = np.float32(1.0) - (1.0 - iou).astype(np.float32)
+        order = rest[iou <= np.float32(iou_thres)]
+    return np.array(keep, dtype=np.int64)
 
 
 class EyeClassifier:
-    def __init__(self, model_path, input_size=128):
-        sess_options = ort.SessionOptions()
-        sess_options.intra_op_num_threads = 3
-        sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-        self.session = ort.InferenceSession(
-            model_path, 
-            sess_options, 
-            providers=['CPUExecutionProvider']
-        )
+    MEAN = 0.485
+    STD = 0.229
+
+    SESSION_DEFAULTS = {
+        "intra_op_num_threads": 3,
+        "execution_mode": "sequential",
+    }
+
+    def __init__(self, model_path, input_size=128, session_options=None):
+        self.session, self.session_settings = make_session(model_path, session_options, self.SESSION_DEFAULTS)
         self.input_name = self.session.get_inputs()[0].name
         self.input_size = input_size
         
         self.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        self.supports_batch = probe_batch_support(self.session, (3, input_size, input_size))
+
+        # uint8 gray -> normalized float in one table lookup
+        levels = np.arange(256, dtype=np.float32) / 255.0
+        self._lut = (levels - np.float32(self.MEAN)) / np.float32(self.STD)
+        self._resized = np.empty((input_size, input_size, 3), dtype=np.uint8)
+        self._gray = np.empty((input_size, input_size), dtype=np.uint8)
+        self._enhanced = np.empty((input_size, input_size), dtype=np.uint8)
+        probe = np.zeros((1, 3, input_size, input_size), dtype=np.float32)
+        start = time.perf_counter()
+        self._output_shape = self.session.run(None, {self.input_name: probe})[0].shape[1:]
+        self.warmup_ms = (time.perf_counter() - start) * 1000
+        self._input = None
+        self._output = None
+        self._bindings = {}
+        self._reserve(2)
+
+    def _reserve(self, batch_size):
+        if self._input is not None and self._input.shape[0] >= batch_size:
+            return
+        s = self.input_size
+        self._input = np.zeros((batch_size, 3, s, s), dtype=np.float32)
+        self._output = np.zeros((batch_size,) + tuple(self._output_shape), dtype=np.float32)
+        self._bindings = {}
+
+    def _run(self, start, count):
+        key = (start, count)
+        if key not in self._bindings:
+            self._bindings[key] = bind_io(
+                self.session, self._input[start:start + count], self._output[start:start + count]
+            )
+        return run_bound(
+            self.session, self._bindings[key],
+            self._input[start:start + count], self._output[start:start + count]
+        )
+
+    def _fill(self, index, img_bgr):
+        cv2.resize(img_bgr, (self.input_size, self.input_size), dst=self._resized)
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        self.clahe.apply(self._gray, dst=self._enhanced)
+        # Normalize one channel, then copy it to the other two (the model expects 3 identical channels)
+        planes = self._input[index]
+        cv2.LUT(self._enhanced, self._lut, dst=planes[0])
+        planes[1] = planes[0]
+        planes[2] = planes[0]
 
     def preprocess(self, img_bgr):
-        img_resized = cv2.resize(img_bgr, (self.input_size, self.input_size))
-        # save_img_bgr(img_resized)
-        gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY)
-        enhanced = self.clahe.apply(gray)
-        img_rgb = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
-        # save_img_bgr(img_rgb)
-        img_float = img_rgb.astype(np.float32) / 255.0
-        mean = np.array([0.485, 0.485, 0.485], dtype=np.float32)
-        std = np.array([0.229, 0.229, 0.229], dtype=np.float32)
-        img_normalized = (img_float - mean) / std
-        img_chw = img_normalized.transpose(2, 0, 1)
-        return np.expand_dims(img_chw, axis=0)
+        self._fill(0, img_bgr)
+        return self._input[:1]
 
     def predict(self, eye_img, thres=0.7):
         if eye_img is None or eye_img.size == 0:
             return 0, 0.0
-        input_tensor = self.preprocess(eye_img)
-        outputs = self.session.run(
-            None,
-            {self.input_name: input_tensor}
-        )
-        logit = float(outputs[0][0][0])
-        prob_open = 1.0 / (1.0 + np.exp(-logit))
-        is_open = int(prob_open > thres)
-
-        return is_open, prob_open
+        return self.predict_batch([eye_img], thres=thres)[0]
 
+    def predict_batch(self, eye_imgs, thres=0.7):
+        """Classify several eye crops with a single session.run. Returns one (is_open, prob_open) per crop."""
+        n = len(eye_imgs)
+        if n == 0:
+            return []
+        start = time.perf_counter()
+        self._reserve(n)
+        for i, img in enumerate(eye_imgs):
+            self._fill(i, img)
+        if self.supports_batch:
+            logits = self._run(0, n).reshape(n, -1)[:, 0]
+        else:
+            logits = [self._run(i, 1).reshape(-1)[0] for i in range(n)]
+        results = []
+        for logit in logits:
+            prob_open = 1.0 / (1.0 + np.exp(-float(logit)))
+            results.append((int(prob_open > thres), prob_open))
+        STAGES["classify"].observe(time.perf_counter() - start)
+        return results
@@ -26,9 +26,114 @@ def create_main_page(logger):
     ts = int(time.time())
     ui.add_body_html(f'''
         <div class="video-container">
-            <img id="cam-stream" src="/video_feed?t={ts}" style="width:100%; height:100%; object-fit:contain;"
-                 onerror="setTimeout(()=>this.src='/video_feed?t='+Date.now(), 1000)">
+            <img id="cam-stream" style="width:100%; height:100%; object-fit:contain;">
+            <canvas id="cam-overlay" style="position:absolute; top:0; left:0; width:100%; height:100%; pointer-events:none;"></canvas>
         </div>
+        <script>
+        // WebSocket stream with per-frame acks; falls back to MJPEG if the socket can't be opened
+        (function() {{
+            const img = document.getElementById('cam-stream');
+            let lastUrl = null, failures = 0;
+            function mjpeg() {{
+                img.onload = null;
+                img.onerror = () => setTimeout(() => img.src = '/video_feed?t=' + Date.now(), 1000);
+                img.src = '/video_feed?t={ts}';
+            }}
+            function connect() {{
+                if (!window.WebSocket) return mjpeg();
+                const proto = location.protocol === 'https:' ? 'wss://' : 'ws://';
+                const ws = new WebSocket(proto + location.host + '/ws/video');
+                ws.binaryType = 'blob';
+                let opened = false;
+                ws.onopen = () => {{ opened = true; failures = 0; }};
+                ws.onmessage = (event) => {{
+                    const url = URL.createObjectURL(event.data);
+                    // Ack even a frame that fails to decode, or the server would stall waiting for it
+                    img.onload = img.onerror = () => {{
+                        if (lastUrl) URL.revokeObjectURL(lastUrl);
+                        lastUrl = url;
+                        if (ws.readyState === WebSocket.OPEN) ws.send('ack');
+                    }};
+                    img.src = url;
+                }};
+                ws.onclose = () => {{
+                    if (!opened && ++failures >= 3) return mjpeg();
+                    setTimeout(connect, 1000);
+                }};
+            }}
+            connect();
+        }})();
+
+        // Boxes, labels, DROWSY banner and timestamp drawn from /ws/meta over the clean video
+        (function() {{
+            const canvas = document.getElementById('cam-overlay');
+            const ctx = canvas.getContext('2d');
+            let meta = null;
+            function corners(x1, y1, x2, y2, color) {{
+                const l = 10;
+                ctx.strokeStyle = color;
+                ctx.lineWidth = 2;
+                ctx.beginPath();
+                ctx.moveTo(x1 + l, y1); ctx.lineTo(x1, y1); ctx.lineTo(x1, y1 + l);
+                ctx.moveTo(x2 - l, y1); ctx.lineTo(x2, y1); ctx.lineTo(x2, y1 + l);
+                ctx.moveTo(x1 + l, y2); ctx.lineTo(x1, y2); ctx.lineTo(x1, y2 - l);
+                ctx.moveTo(x2 - l, y2); ctx.lineTo(x2, y2); ctx.lineTo(x2, y2 - l);
+                ctx.stroke();
+            }}
+            function label(text, x, y, color) {{
+                ctx.fillStyle = color;
+                ctx.font = '13px sans-serif';
+                ctx.fillText(text, x, y - 8);
+            }}
+            function draw() {{
+                const cw = canvas.clientWidth, ch = canvas.clientHeight;
+                if (canvas.width !== cw || canvas.height !== ch) {{ canvas.width = cw; canvas.height = ch; }}
+                ctx.clearRect(0, 0, cw, ch);
+                if (!meta) return;
+                // Same letterboxing as object-fit: contain on the <img>
+                const k = Math.min(cw / meta.w, ch / meta.h);
+                const ox = (cw - meta.w * k) / 2, oy = (ch - meta.h * k) / 2;
+                const X = (v) => ox + v * k, Y = (v) => oy + v * k;
+                for (const e of meta.eyes) {{
+                    const color = e.open ? '#00ff00' : '#ff0000';
+                    corners(X(e.box[0]), Y(e.box[1]), X(e.box[2]), Y(e.box[3]), color);
+                    label((e.open ? 'Open ' : 'Closed ') + e.prob.toFixed(2), X(e.box[0]), Y(e.box[1]), color);
+                }}
+                for (const e of meta.ignored) {{
+                    corners(X(e.box[0]), Y(e.box[1]), X(e.box[2]), Y(e.box[3]), '#c0c0c0');
+                    label('Ignored' + (e.prob === null ? '' : ' ' + e.prob.toFixed(2)), X(e.box[0]), Y(e.box[1]), '#c0c0c0');
+                }}
+                if (meta.crop) {{
+                    ctx.strokeStyle = '#ffff00';
+                    ctx.lineWidth = 2;
+                    ctx.strokeRect(X(meta.crop[0]), Y(meta.crop[1]), meta.crop[2] * k, meta.crop[3] * k);
+                }}
+                if (meta.alert) {{
+                    ctx.fillStyle = '#ff0000';
+                    ctx.font = 'bold 36px sans-serif';
+                    ctx.fillText('DROWSY!', X(50), Y(100));
+                }}
+                const d = new Date(meta.ts), p = (n) => String(n).padStart(2, '0');
+                const stamp = d.getFullYear() + '-' + p(d.getMonth() + 1) + '-' + p(d.getDate()) + ' ' +
+                              p(d.getHours()) + ':' + p(d.getMinutes()) + ':' + p(d.getSeconds());
+                ctx.font = '14px monospace';
+                ctx.lineWidth = 3;
+                ctx.strokeStyle = '#000000';
+                ctx.strokeText(stamp, X(10), Y(meta.h - 20));
+                ctx.fillStyle = '#ffff00';
+                ctx.fillText(stamp, X(10), Y(meta.h - 20));
+            }}
+            function connect() {{
+                if (!window.WebSocket) return;
+                const proto = location.protocol === 'https:' ? 'wss://' : 'ws://';
+                const ws = new WebSocket(proto + location.host + '/ws/meta');
+                ws.onmessage = (event) => {{ meta = JSON.parse(event.data); requestAnimationFrame(draw); }};
+                ws.onclose = () => {{ meta = null; requestAnimationFrame(draw); setTimeout(connect, 1000); }};
+            }}
+            window.addEventListener('resize', () => requestAnimationFrame(draw));
+            connect();
+        }})();
+        </script>
     ''')
 
     with ui.right_drawer(value=False).classes('bg-[#111827] text-white q-pa-md ui-overlay').props('width=340 behavior="mobile" overlay') as drawer:
@@ -230,30 +335,32 @@ def create_main_page(logger):
                     on_change=lambda e: state.config_mgr.set("crop_enabled", e.value)
                 ).props('dense color=green right-label').classes('text-xs text-green-400')
 
+            cam_w = state.config_mgr.get("camera_width", 1280)
+            cam_h = state.config_mgr.get("camera_height", 720)
             with ui.card().classes('setting-card w-full shadow-lg border-teal-900/30'):
                 ui.label('Horizontal (X / Width)').classes('text-[11px] font-bold text-teal-200/70 mb-1')
                 with ui.row().classes('w-full gap-2 items-center mb-3 no-wrap'):
                     ui.icon('swap_horiz', size='xs', color='teal')
-                    ui.slider(min=0, max=state.CAM_WIDTH, step=10, 
+                    ui.slider(min=0, max=cam_w, step=10, 
                             value=state.config_mgr.get("crop_x", 0),
                             on_change=lambda e: state.config_mgr.set("crop_x", int(e.value))) \
                         .props('label-always dense color=teal').classes('col-grow')
                     
-                    ui.slider(min=state.MIN_CROP_SIZE, max=state.CAM_WIDTH, step=10, 
-                            value=state.config_mgr.get("crop_w", state.CAM_WIDTH),
+                    ui.slider(min=state.MIN_CROP_SIZE, max=cam_w, step=10, 
+                            value=state.config_mgr.get("crop_w", cam_w),
                             on_change=lambda e: state.config_mgr.set("crop_w", int(e.value))) \
                         .props('label-always dense color=cyan').classes('col-grow')
 
                 ui.label('Vertical (Y / Height)').classes('text-[11px] font-bold text-blue-200/70 mb-1')
                 with ui.row().classes('w-full gap-2 items-center no-wrap'):
                     ui.icon('swap_vert', size='xs', color='blue')
-                    ui.slider(min=0, max=state.CAM_HEIGHT, step=10, 
+                    ui.slider(min=0, max=cam_h, step=10, 
                             value=state.config_mgr.get("crop_y", 0),
                             on_change=lambda e: state.config_mgr.set("crop_y", int(e.value))) \
                         .props('label-always dense color=blue').classes('col-grow')
                     
-                    ui.slider(min=state.MIN_CROP_SIZE, max=state.CAM_HEIGHT, step=10, 
-                            value=state.config_mgr.get("crop_h", state.CAM_HEIGHT),
+                    ui.slider(min=state.MIN_CROP_SIZE, max=cam_h, step=10, 
+                            value=state.config_mgr.get("crop_h", cam_h),
                             on_change=lambda e: state.config_mgr.set("crop_h", int(e.value))) \
                         .props('label-always dense color=indigo').classes('col-grow')
                 
@@ -276,13 +383,15 @@ def create_main_page(logger):
                     with ui.row().classes('items-center gap-1'):
                         ui.icon('timer', size='xs', color='yellow-600')
                         ui.label('Interval (s)').classes('text-sm font-medium text-slate-300')
-                    ui.label().bind_text_from(state.config_mgr.config, 'data_collection_interval', backward=lambda x: f"{int(x or 10)}s").classes('text-xs font-bold text-yellow-500')
+                    interval_label = ui.label().classes('text-xs font-bold text-yellow-500')
 
-                ui.slider(
+                interval_slider = ui.slider(
                     min=1, max=60, step=1,
                     value=state.config_mgr.get("data_collection_interval", 10),
                     on_change=lambda e: state.config_mgr.set("data_collection_interval", int(e.value))
                 ).props('label-always dense color=yellow').classes('w-full mb-4')
+                # Config snapshots are replaced on every write, so bind to the slider rather than the config dict
+                interval_label.bind_text_from(interval_slider, 'value', backward=lambda x: f"{int(x or 10)}s")
 
                 ui.separator().classes('bg-slate-700 mb-4')
 
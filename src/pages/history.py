@@ -52,13 +52,15 @@ async def create_history_page():
 
     video_files_map = {} 
     all_vids = []
-    all_vids.extend(glob.glob(os.path.join(vid_dir, "*.mp4")))
-    all_vids.extend(glob.glob(os.path.join(vid_dir, "*.avi")))
-    all_vids.extend(glob.glob(os.path.join(vid_dir, "*.mkv")))
+    # With several cameras each one records into logs/videos/<camera id>
+    for pattern in ("*.mp4", "*.avi", "*.mkv", "*/*.mp4"):
+        all_vids.extend(glob.glob(os.path.join(vid_dir, pattern)))
     
     for v_path in sorted(all_vids):
         try:
             fname = os.path.basename(v_path)
+            rel_path = os.path.relpath(v_path, vid_dir).replace(os.sep, '/')
+            camera = os.path.dirname(rel_path) or None
             name_no_ext = os.path.splitext(fname)[0]
             parts = name_no_ext.split('_') 
             if len(parts) >= 3:
@@ -66,16 +68,17 @@ async def create_history_page():
                 t_str = parts[2]
                 dt_vid = datetime.strptime(f"{d_str}_{t_str}", "%Y%m%d_%H%M%S")
                 
-                if d_str not in video_files_map: video_files_map[d_str] = []
-                video_files_map[d_str].append({
+                key = (camera, d_str)
+                if key not in video_files_map: video_files_map[key] = []
+                video_files_map[key].append({
                     'dt': dt_vid,
-                    'url': f'/captured_videos/{fname}',
+                    'url': f'/captured_videos/{rel_path}',
                     'used': False,   
                 })
         except: continue
 
-    def find_matching_video(img_dt):
-        d_key = img_dt.strftime("%Y%m%d")
+    def find_matching_video(img_dt, camera=None):
+        d_key = (camera, img_dt.strftime("%Y%m%d"))
         if d_key not in video_files_map: return None
         candidates = video_files_map[d_key]
         best_vid = None
@@ -101,11 +104,13 @@ async def create_history_page():
             if len(parts) < 4: continue
             date_part = parts[2]
             time_part = parts[3].split('.')[0]
+            # suspected_annotated_<date>_<time>[_<camera id>].jpg
+            camera = os.path.splitext('_'.join(parts[4:]))[0] or None
             
             if date_part in valid_keys:
                 dt = datetime.strptime(f"{date_part}_{time_part}", "%Y%m%d_%H%M%S")
                 slot_idx = dt.hour // 2 
-                vid_url = find_matching_video(dt)
+                vid_url = find_matching_video(dt, camera)
                 grouped_data[date_part][slot_idx].append({
                     'image_url': f'/captured_images/{filename}',
                     'video_url': vid_url, 
@@ -0,0 +1,68 @@
+import threading
+from collections import deque
+
+import global_state as state
+
+
+class LatestQueue:
+    """Bounded hand-off between pipeline stages. When full, the oldest item is dropped."""
+
+    def __init__(self, name, maxsize=1):
+        self.name = name
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.get_count = 0
+        self.drop_count = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.drop_count += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+                if not self._items:
+                    return None
+            self.get_count += 1
+            return self._items.popleft()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "depth": len(self._items),
+                "maxsize": self.maxsize,
+                "put": self.put_count,
+                "get": self.get_count,
+                "dropped": self.drop_count,
+            }
+
+
+def register_queue(queue):
+    state.pipeline_queues[queue.name] = queue
+    return queue
+
+
+def get_pipeline_stats():
+    return {name: q.stats() for name, q in list(state.pipeline_queues.items())}
+
+
+def register_stats(name, provider):
+    state.stats_providers[name] = provider
+
+
+def collect_stats():
+    stats = {"pipeline": get_pipeline_stats()}
+    for name, provider in list(state.stats_providers.items()):
+        try:
+            stats[name] = provider()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    return stats
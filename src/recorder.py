@@ -1,82 +1,704 @@
 import cv2
 import threading
+import queue
 import time
 import os
-import subprocess 
+import subprocess
+import json
+import glob
+import shutil
+import re
 from collections import deque
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from src.metrics import evidence_encode_seconds, evidence_encodes_total
+
+
+class FFmpegEncoder:
+    """
+    One ffmpeg process that turns concatenated JPEG frames into the final H.264 .mp4 in a single pass.
+    Frames come from stdin (write()) or, when `source` is a path, from an MJPEG spool file.
+    """
+
+    def __init__(self, output_path, fps, preset="ultrafast", crf=28, source='-', low_priority=False):
+        self.output_path = output_path
+        self.source = source
+        self.low_priority = low_priority
+        self.fps = fps
+        self.preset = preset
+        self.crf = crf
+        self.process = None
+        self.frames = 0
+        self.start_time = None
+
+    def command(self):
+        return (low_priority_prefix() if self.low_priority else []) + [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'image2pipe', '-c:v', 'mjpeg', '-framerate', str(self.fps),
+            '-i', self.source,
+            '-c:v', 'libx264',
+            '-preset', str(self.preset),
+            '-crf', str(self.crf),
+            '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            '-f', 'mp4',
+            self.output_path
+        ]
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.process = subprocess.Popen(
+            self.command(),
+            stdin=subprocess.PIPE if self.source == '-' else subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def write(self, jpeg):
+        self.process.stdin.write(jpeg)
+        self.frames += 1
+
+    def close(self):
+        """Finish the file and return a small report: frames, encode seconds, output bytes, success."""
+        try:
+            if self.process.stdin:
+                self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = self.process.wait()
+        size = os.path.getsize(self.output_path) if os.path.exists(self.output_path) else 0
+        return {
+            "path": self.output_path,
+            "frames": self.frames,
+            "encode_seconds": round(time.monotonic() - self.start_time, 3),
+            "bytes": size,
+            "ok": returncode == 0 and size > 0,
+        }
+
+
+def low_priority_prefix():
+    """nice/ionice wrapper so evidence encoding yields CPU and SD-card IO to inference."""
+    prefix = []
+    if shutil.which('nice'):
+        prefix += ['nice', '-n', '19']
+    if shutil.which('ionice'):
+        prefix += ['ionice', '-c', '3']
+    return prefix
+
+
+class EncodeQueue:
+    """
+    Persistent queue of evidence encode jobs run by a fixed number of low-priority workers.
+
+    A job is an MJPEG spool written while the clip was captured. Jobs are journaled before they
+    are queued and removed after the final .mp4 is in place, so after a crash recover() can
+    re-queue them and delete half-written temp files. The spool of a failed encode is renamed
+    to failed_*.mjpeg and left for manual recovery.
+
+    Live encodes (LiveClip) share the same worker budget: start_live() only grants one when the
+    queue is empty and a worker slot is free, and they report back through finish_encode().
+    """
+
+    def __init__(self, journal_path="logs/videos/encode_journal.json", workers=1):
+        self.journal_path = journal_path
+        os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.journal = {}
+        self.running = 0
+        self.live = 0
+        self.completed = 0
+        self.failed = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self.last_encode = None
+        self.workers = []
+        for i in range(max(1, int(workers))):
+            worker = threading.Thread(target=self._worker, name=f"encode-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _write_journal(self):
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.journal, f)
+        os.replace(tmp_path, self.journal_path)
+
+    def submit(self, job):
+        job.setdefault("queued_at", time.time())
+        with self.lock:
+            # Keyed by output path: ids are timestamps, and cameras sharing this queue can alert in the same second
+            self.journal[job["output"]] = job
+            self._write_journal()
+        self.jobs.put(job)
+
+    def start_live(self):
+        """Reserve a worker slot for a clip encoded while it is captured. False when encodes are backed up."""
+        with self.lock:
+            if self.jobs.qsize() or self.running + self.live >= len(self.workers):
+                return False
+            self.live += 1
+            return True
+
+    def end_live(self):
+        with self.lock:
+            self.live -= 1
+
+    def recover(self, save_dirs, fps=15):
+        """Re-queue journaled jobs, salvage spools of clips cut off mid-capture, delete other temp files."""
+        try:
+            with open(self.journal_path) as f:
+                pending = json.load(f)
+        except (OSError, ValueError):
+            pending = {}
+
+        # Clean up first and submit afterwards, so a worker's fresh temp output is never mistaken for an orphan
+        resume, keep = [], set()
+        for job in pending.values():
+            if os.path.exists(job.get("spool", "")) and os.path.getsize(job["spool"]) > 0:
+                keep.update(os.path.abspath(p) for p in [job["spool"]] + job.get("pre_segments", []))
+                resume.append(job)
+
+        for save_dir in save_dirs:
+            salvage = {}
+            for path in sorted(glob.glob(os.path.join(save_dir, "temp_*"))):
+                if os.path.abspath(path) in keep:
+                    continue
+                match = SPOOL_PATTERN.match(os.path.basename(path))
+                if match and os.path.getsize(path) > 0:
+                    salvage.setdefault(match.group(1), []).append(path)
+                    continue
+                try:
+                    os.remove(path)
+                    print(f"[RECORDER] Removed orphaned temp file {path}")
+                except OSError:
+                    pass
+
+            for stamp, paths in salvage.items():
+                print(f"[RECORDER] Salvaging interrupted clip {stamp}")
+                job = make_encode_job(save_dir, stamp, fps, pre_segments=[p for p in paths if "_pre" in p])
+                if not os.path.exists(job["spool"]):
+                    open(job["spool"], "ab").close()
+                resume.append(job)
+
+        for job in resume:
+            print(f"[RECORDER] Resuming encode job {job['id']}")
+            self.submit(job)
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            with self.lock:
+                self.running += 1
+                self.last_wait = max(0.0, time.time() - job["queued_at"])
+                self.max_wait = max(self.max_wait, self.last_wait)
+            try:
+                self._run_job(job)
+            except Exception as e:
+                print(f"[RECORDER] Encode job {job['id']} error: {e}")
+                with self.lock:
+                    self.failed += 1
+            finally:
+                with self.lock:
+                    self.running -= 1
+
+    def _run_job(self, job):
+        # Not .mp4, so the history page never lists a half-written file
+        temp_output = os.path.join(os.path.dirname(job["output"]), f"temp_{job['id']}.part")
+        pre_segments = job.get("pre_segments", [])
+        encoder = FFmpegEncoder(
+            temp_output, job["fps"], preset=job["preset"], crf=job["crf"],
+            source='-' if pre_segments else job["spool"], low_priority=True
+        )
+        encoder.start()
+        if pre_segments:
+            # Disk lookback: the MJPEG segments and the live spool are one concatenated stream
+            try:
+                for path in pre_segments + [job["spool"]]:
+                    with open(path, "rb") as f:
+                        shutil.copyfileobj(f, encoder.process.stdin, 256 * 1024)
+            except (BrokenPipeError, OSError) as e:
+                print(f"[RECORDER] Feeding {job['id']} to ffmpeg failed: {e}")
+        report = encoder.close()
+        report["frames"] = job.get("frames")
+        report["wait_seconds"] = round(self.last_wait, 3)
+        self.finish_encode(job, temp_output, report, pre_segments + [job["spool"]])
+
+    def finish_encode(self, job, temp_output, report, sources):
+        """Publish a finished encode (or keep its frames if it failed) and update the counters."""
+        evidence_encode_seconds.observe(report.get("encode_seconds") or 0.0)
+        evidence_encodes_total.labels("ok" if report["ok"] else "failed").inc()
+
+        if report["ok"]:
+            os.replace(temp_output, job["output"])
+            report["path"] = job["output"]
+            print(f"[RECORDER] Saved web-ready video: {job['output']} "
+                  f"({report['frames']} frames, {report['encode_seconds']}s, {report['bytes'] // 1024} KB)")
+        else:
+            print(f"[RECORDER] ffmpeg failed for {job['output']}")
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+
+        # A failed encode won't get better on retry, but the frames are evidence: keep them as
+        # failed_*.mjpeg (recover() only looks at temp_*) instead of deleting them
+        for path in sources:
+            if not os.path.exists(path):
+                continue
+            if report["ok"]:
+                os.remove(path)
+                continue
+            kept = os.path.join(os.path.dirname(path), "failed_" + os.path.basename(path)[len("temp_"):])
+            try:
+                os.replace(path, kept)
+                print(f"[RECORDER] Kept frames of failed encode as {kept}")
+            except OSError as e:
+                print(f"[RECORDER] Could not keep {path}: {e}")
+        with self.lock:
+            self.journal.pop(job["output"], None)
+            self._write_journal()
+            self.last_encode = report
+            if report["ok"]:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": self.jobs.qsize(),
+                "running": self.running,
+                "live": self.live,
+                "workers": len(self.workers),
+                "completed": self.completed,
+                "failed": self.failed,
+                "last_wait_seconds": round(self.last_wait, 3),
+                "max_wait_seconds": round(self.max_wait, 3),
+                "last_encode": self.last_encode,
+            }
+
+
+SPOOL_PATTERN = re.compile(r"temp_(\d{8}_\d{6})(_pre\d+)?\.mjpeg$")
+
+
+def make_encode_job(save_dir, stamp, fps, preset="ultrafast", crf=28, frames=None, pre_segments=None):
+    return {
+        "id": stamp,
+        "spool": os.path.join(save_dir, f"temp_{stamp}.mjpeg"),
+        "pre_segments": pre_segments or [],
+        "output": os.path.join(save_dir, f"evidence_{stamp}.mp4"),
+        "fps": fps,
+        "preset": preset,
+        "crf": crf,
+        "frames": frames,
+    }
+
+
+class SegmentRing:
+    """
+    Continuous on-disk lookback: decimated JPEG frames are appended to fixed-length MJPEG segment
+    files (no re-encoding), and the oldest segments are deleted beyond max_segments.
+    """
+
+    def __init__(self, segment_dir="logs/segments", segment_seconds=10, lookback_seconds=120):
+        self.segment_dir = segment_dir
+        os.makedirs(segment_dir, exist_ok=True)
+        self.segment_seconds = segment_seconds
+        self.max_segments = int(-(-lookback_seconds // segment_seconds)) + 1
+        self.current = None
+        self.current_start = 0.0
+        self.bytes_written = 0
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.segment_dir, "seg_*.mjpeg")))
+
+    @staticmethod
+    def _segment_start(path):
+        return int(os.path.basename(path)[len("seg_"):-len(".mjpeg")]) / 1000.0
+
+    def rotate(self, wall_time):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        stamp_ms = int(wall_time * 1000)
+        self.current = open(os.path.join(self.segment_dir, f"seg_{stamp_ms}.mjpeg"), "ab")
+        self.current_start = stamp_ms / 1000.0
+        for old in self._segments()[:-self.max_segments]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def append(self, jpeg, wall_time):
+        try:
+            if self.current is None or wall_time - self.current_start >= self.segment_seconds:
+                self.rotate(wall_time)
+            self.current.write(jpeg)
+            self.bytes_written += len(jpeg)
+        except OSError as e:
+            print(f"[RECORDER] Segment write error: {e}")
+
+    def link_since(self, wall_time, dest_prefix):
+        """
+        Close the current segment and hard-link (or copy) every segment that overlaps
+        [wall_time, now] to dest_prefix + "_preNN.mjpeg", so ring rotation can't delete them
+        before the clip is encoded. Returns the new paths, oldest first.
+        """
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        segments = self._segments()
+        starts = [self._segment_start(p) for p in segments]
+        linked = []
+        for i, path in enumerate(segments):
+            # A gap (e.g. a restart) ends a segment early
+            end = starts[i] + self.segment_seconds
+            if i + 1 < len(segments):
+                end = min(end, starts[i + 1])
+            elif self.current_start == starts[i]:
+                end = float("inf")
+            if end < wall_time:
+                continue
+            dest = f"{dest_prefix}_pre{len(linked):02d}.mjpeg"
+            try:
+                os.link(path, dest)
+            except OSError:
+                shutil.copyfile(path, dest)
+            linked.append(dest)
+        return linked
+
+    def stats(self):
+        segments = self._segments()
+        return {
+            "segments": len(segments),
+            "max_segments": self.max_segments,
+            "seconds": round(len(segments) * self.segment_seconds, 1),
+            "bytes": sum(os.path.getsize(p) for p in segments if os.path.exists(p)),
+        }
+
+
+class SpoolClip:
+    """An open clip written to an MJPEG spool; finish() hands the spool to the EncodeQueue."""
+
+    def __init__(self, encode_queue, save_dir, stamp, fps, preset, crf):
+        self.encode_queue = encode_queue
+        self.job = make_encode_job(save_dir, stamp, fps, preset, crf)
+        self.file = open(self.job["spool"], "ab")
+
+    def add_segments(self, paths):
+        # Encoded in front of the spool by the queue worker
+        self.job["pre_segments"] = list(paths)
+
+    def write(self, jpeg):
+        self.file.write(jpeg)
+
+    def finish(self, frames):
+        try:
+            self.file.close()
+        except OSError:
+            pass
+        self.job["frames"] = frames
+        self.encode_queue.submit(self.job)
+
+    def wait(self, timeout=None):
+        pass
+
+
+class LiveClip:
+    """
+    An open clip streamed straight into a low-priority ffmpeg, so its frames reach the SD card once,
+    as the .mp4. A feeder thread does the pipe writes and the final wait; write() never blocks.
+
+    Frames stay in memory until the output file has grown past them. If ffmpeg dies, stops making
+    progress for max_backlog frames, or fails when it is closed, those frames and the rest of the
+    clip go to an MJPEG spool queued as a normal encode job under the next second's timestamp: the
+    clip continues in a second file (or is kept as failed_*.mjpeg) instead of being lost.
+    """
+
+    def __init__(self, encode_queue, save_dir, stamp, fps, preset, crf, max_backlog):
+        self.encode_queue = encode_queue
+        self.save_dir = save_dir
+        self.stamp = stamp
+        self.fps, self.preset, self.crf = fps, preset, crf
+        self.max_backlog = max_backlog
+        self.job = make_encode_job(save_dir, stamp, fps, preset, crf)
+        self.temp_output = os.path.join(save_dir, f"temp_{stamp}.part")
+        self.encoder = FFmpegEncoder(self.temp_output, fps, preset=preset, crf=crf, low_priority=True)
+        self.items = queue.Queue()
+        self.segments = []
+        # Frames fed since the output last grew (newer) and before that (older)
+        self.unconfirmed = ([], [])
+        self.output_size = 0
+        self.fallback = None
+        self.fallback_file = None
+        self.frames = 0
+        self.encoder.start()
+        self.thread = threading.Thread(target=self._run, name=f"clip-{stamp}", daemon=True)
+        self.thread.start()
+
+    def add_segments(self, paths):
+        # Hard-linked lookback segments are piped in as they are, no re-spooling
+        self.segments = list(paths)
+        for path in self.segments:
+            self.items.put(path)
+
+    def write(self, jpeg):
+        self.items.put(jpeg)
+
+    def finish(self, frames):
+        self.frames = frames
+        self.items.put(None)
+
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+
+    def _feed(self, item):
+        if not isinstance(item, bytes):
+            # Segment files stay on disk until the encode is done, no need to hold them
+            with open(item, "rb") as f:
+                shutil.copyfileobj(f, self.encoder.process.stdin, 256 * 1024)
+            return
+        self.encoder.write(item)
+        older, newer = self.unconfirmed
+        newer.append(item)
+        size = os.path.getsize(self.temp_output) if os.path.exists(self.temp_output) else 0
+        if size > self.output_size:
+            # ffmpeg has written past everything fed before the previous growth
+            self.output_size = size
+            self.unconfirmed = (newer, [])
+        elif len(older) + len(newer) > self.max_backlog:
+            self._fall_back("made no progress")
+
+    def _spool(self, item):
+        if self.fallback_file is None:
+            return
+        try:
+            if isinstance(item, bytes):
+                self.fallback_file.write(item)
+                self.fallback["frames"] += 1
+            else:
+                with open(item, "rb") as f:
+                    shutil.copyfileobj(f, self.fallback_file, 256 * 1024)
+        except OSError as e:
+            print(f"[RECORDER] Spool write error: {e}")
+
+    def _fall_back(self, reason):
+        stamp = datetime.strptime(self.stamp, "%Y%m%d_%H%M%S") + timedelta(seconds=1)
+        self.fallback = make_encode_job(self.save_dir, stamp.strftime("%Y%m%d_%H%M%S"), self.fps, self.preset, self.crf, frames=0)
+        try:
+            self.fallback_file = open(self.fallback["spool"], "ab")
+        except OSError as e:
+            print(f"[RECORDER] Cannot open fallback spool: {e}")
+        print(f"[RECORDER] Live encode of {self.stamp} {reason}; spooling the rest to {self.fallback['spool']}")
+        older, newer = self.unconfirmed
+        self.unconfirmed = ([], [])
+        for item in older + newer:
+            self._spool(item)
+
+    def _run(self):
+        while True:
+            item = self.items.get()
+            if item is None:
+                break
+            if self.fallback is None:
+                try:
+                    self._feed(item)
+                    continue
+                except (BrokenPipeError, OSError) as e:
+                    self._fall_back(f"failed ({e})")
+            self._spool(item)
+
+        report = self.encoder.close()
+        report["frames"] = self.frames
+        report["wait_seconds"] = 0.0
+        if not report["ok"] and self.fallback is None:
+            self._fall_back("failed")
+        self.encode_queue.end_live()
+        self.encode_queue.finish_encode(self.job, self.temp_output, report, self.segments)
+        if self.fallback_file is not None:
+            self.fallback_file.close()
+            self.encode_queue.submit(self.fallback)
+
 
 class EvidenceRecorder:
-    def __init__(self, save_dir="logs/videos", buffer_seconds=5, fps=15):
+    """
+    Keeps a short pre-event ring of JPEG frames. An alert opens a clip containing that ring plus
+    every following frame until post_seconds after the last alert; alerts during an open clip
+    extend it (up to max_clip_seconds). With live_encode, and while the EncodeQueue has a free
+    slot, clip frames go straight into ffmpeg (LiveClip). Otherwise they are appended to an MJPEG
+    spool on disk and the finished spool is handed to the EncodeQueue (SpoolClip); that costs a
+    second pass over the SD card but survives a crash.
+
+    With a SegmentRing the lookback comes from disk instead: the segments covering
+    lookback_seconds are hard-linked next to the clip and encoded in front of it.
+    """
+
+    def __init__(self, save_dir="logs/videos", buffer_seconds=5, fps=15, jpeg_quality=80, preset="ultrafast", crf=28,
+                 post_seconds=5, max_clip_seconds=60, encode_queue=None, segment_ring=None, lookback_seconds=None,
+                 live_encode=True):
         self.save_dir = save_dir
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
-            
+
         self.fps = fps
         self.buffer_size = buffer_seconds * fps
+        # Pre-event ring of (capture time, JPEG bytes), decimated to self.fps
         self.frame_buffer = deque(maxlen=self.buffer_size)
+        self.buffer_bytes = 0
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+        self.next_frame_time = 0.0
         self.lock = threading.Lock()
-        self.is_recording = False
-        self.last_save_time = 0
-        self.cooldown = 10 
+        self.preset = preset
+        self.crf = crf
+        if encode_queue is None:
+            encode_queue = EncodeQueue(os.path.join(save_dir, "encode_journal.json"))
+            encode_queue.recover([save_dir], fps=fps)
+        self.encode_queue = encode_queue
+        # Optional disk lookback; when set, clips start from the segments instead of the RAM ring
+        self.segment_ring = segment_ring
+        self.lookback_seconds = lookback_seconds if lookback_seconds is not None else buffer_seconds
+        self.live_encode = live_encode
 
-    def update(self, frame):
-        if frame is None: return
-        with self.lock:
-            self.frame_buffer.append(frame.copy())
+        # Active clip
+        self.post_seconds = post_seconds
+        self.max_clip_seconds = max_clip_seconds
+        self.clip = None
+        self.clip_frames = 0
+        self.clip_start = 0.0
+        self.clip_deadline = 0.0
+        self.last_clip_frame_time = 0.0
+        self.last_clip_jpeg = None
+        self.clips_saved = 0
+
+    @property
+    def is_recording(self):
+        return self.clip is not None
 
-    def save_evidence(self):
-        now = time.time()
-        if self.is_recording or (now - self.last_save_time < self.cooldown):
+    def wants_frame(self, now):
+        return now >= self.next_frame_time
+
+    def update(self, frame=None, jpeg=None, now=None):
+        """
+        Offer a frame to the recorder. Frames arriving faster than self.fps are skipped
+        before any encoding. Pass `jpeg` when compressed bytes are already available.
+        """
+        now = time.monotonic() if now is None else now
+        if not self.wants_frame(now):
             return
+        if jpeg is None:
+            if frame is None: return
+            ret, buffer = cv2.imencode('.jpg', frame, self.encode_params)
+            if not ret: return
+            jpeg = buffer.tobytes()
+
+        interval = 1.0 / self.fps
+        missed = 0
+        # Stay on the fps grid unless we fell more than a frame behind
+        if now - self.next_frame_time > interval:
+            missed = int((now - self.next_frame_time) / interval)
+            self.next_frame_time = now
+        self.next_frame_time += interval
+
+        with self.lock:
+            if missed and self.clip is not None and self.last_clip_jpeg is not None and now <= self.clip_deadline:
+                # Clip frames come at inference rate, which can be below self.fps. ffmpeg plays the
+                # spool at a fixed self.fps, so repeat the last frame for every grid slot that was
+                # skipped to keep the clip in real time.
+                for _ in range(min(missed, int(self.max_clip_seconds * self.fps))):
+                    if self.segment_ring is not None:
+                        self.segment_ring.append(self.last_clip_jpeg, time.time())
+                    self._write_clip_frame(self.last_clip_frame_time, self.last_clip_jpeg)
+
+            if len(self.frame_buffer) == self.frame_buffer.maxlen:
+                self.buffer_bytes -= len(self.frame_buffer[0][1])
+            self.frame_buffer.append((now, jpeg))
+            self.buffer_bytes += len(jpeg)
+
+            if self.segment_ring is not None:
+                self.segment_ring.append(jpeg, time.time())
 
-        self.is_recording = True
-        self.last_save_time = now
-        threading.Thread(target=self._worker_save, daemon=True).start()
+            if self.clip is not None:
+                if now <= self.clip_deadline:
+                    self._write_clip_frame(now, jpeg)
+                else:
+                    self._finish_clip()
 
-    def _worker_save(self):
+    def _write_clip_frame(self, now, jpeg):
         try:
-            with self.lock:
-                frames_to_save = list(self.frame_buffer)
-            
-            if not frames_to_save:
-                self.is_recording = False
+            self.clip.write(jpeg)
+            self.clip_frames += 1
+            self.last_clip_frame_time = now
+            self.last_clip_jpeg = jpeg
+        except OSError as e:
+            print(f"[RECORDER] Spool write error: {e}")
+
+    def _finish_clip(self):
+        clip, self.clip = self.clip, None
+        clip.finish(self.clip_frames)
+        self.clips_saved += 1
+
+    def tick(self, now=None):
+        """Close the open clip once its deadline has passed, even if no frames arrive (camera stall, source ended)."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.clip is not None and now > self.clip_deadline:
+                self._finish_clip()
+
+    def close(self, timeout=30.0):
+        """Hand any open clip to the encoder (called on shutdown); a live encode is waited for."""
+        with self.lock:
+            clip = self.clip
+            if clip is not None:
+                self._finish_clip()
+        if clip is not None:
+            clip.wait(timeout)
+
+    def stats(self):
+        with self.lock:
+            frames = len(self.frame_buffer)
+            span = self.frame_buffer[-1][0] - self.frame_buffer[0][0] if frames > 1 else 0.0
+            return {
+                "buffer_frames": frames,
+                "buffer_capacity": self.frame_buffer.maxlen,
+                "buffer_seconds": round(span, 2),
+                "buffer_bytes": self.buffer_bytes,
+                "is_recording": self.is_recording,
+                "clip_seconds": round(time.monotonic() - self.clip_start, 2) if self.is_recording else 0.0,
+                "clip_frames": self.clip_frames if self.is_recording else 0,
+                "clips_saved": self.clips_saved,
+                "segments": self.segment_ring.stats() if self.segment_ring is not None else None,
+            }
+
+    def save_evidence(self, now=None):
+        """Open a clip for an alert, or extend the open one. Safe to call on every alert frame."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.clip is not None:
+                self.clip_deadline = min(now + self.post_seconds, self.clip_start + self.max_clip_seconds)
+                return
+
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            try:
+                if self.live_encode and self.encode_queue.start_live():
+                    try:
+                        # Room for the whole RAM pre-roll plus ~2 s of slack before falling back to a spool
+                        self.clip = LiveClip(self.encode_queue, self.save_dir, stamp, self.fps, self.preset, self.crf,
+                                             max_backlog=self.buffer_size + 2 * self.fps)
+                    except OSError:
+                        self.encode_queue.end_live()
+                        raise
+                else:
+                    self.clip = SpoolClip(self.encode_queue, self.save_dir, stamp, self.fps, self.preset, self.crf)
+            except OSError as e:
+                print(f"[RECORDER] Cannot open clip: {e}")
+                return
+            print(f"[RECORDER] Recording clip: evidence_{stamp}.mp4 ({type(self.clip).__name__})...")
+            self.clip_frames = 0
+            self.last_clip_jpeg = None
+            self.clip_start = now
+            self.clip_deadline = now + min(self.post_seconds, self.max_clip_seconds)
+            if self.segment_ring is not None:
+                prefix = os.path.join(self.save_dir, f"temp_{stamp}")
+                self.clip.add_segments(self.segment_ring.link_since(time.time() - self.lookback_seconds, prefix))
                 return
-            
-            temp_filename = datetime.now().strftime("temp_%Y%m%d_%H%M%S.avi")
-            temp_filepath = os.path.join(self.save_dir, temp_filename)
-            
-            final_filename = datetime.now().strftime("evidence_%Y%m%d_%H%M%S.mp4")
-            final_filepath = os.path.join(self.save_dir, final_filename)
-
-            h, w = frames_to_save[0].shape[:2]
-            fourcc = cv2.VideoWriter_fourcc(*'MJPG') # Codec này Pi xử lý rất nhẹ
-            out = cv2.VideoWriter(temp_filepath, fourcc, self.fps, (w, h))
-
-            for frame in frames_to_save:
-                out.write(frame)
-            out.release()
-            
-            print(f"[RECORDER] Converting to MP4: {final_filename}...")
-            
-            command = [
-                'ffmpeg', '-y', 
-                '-i', temp_filepath, 
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast', 
-                '-crf', '28', 
-                '-pix_fmt', 'yuv420p', 
-                final_filepath 
-            ]
-            
-            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            
-            if os.path.exists(temp_filepath):
-                os.remove(temp_filepath)
-                
-            print(f"[RECORDER] Saved web-ready video: {final_filepath}")
-
-        except Exception as e:
-            print(f"[RECORDER] Error: {e}")
-        finally:
-            self.is_recording = False
\ No newline at end of file
+            for ts, jpeg in self.frame_buffer:
+                if ts > self.last_clip_frame_time:
+                    self._write_clip_frame(ts, jpeg)
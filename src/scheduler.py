@@ -0,0 +1,93 @@
+import time
+from collections import deque
+
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class DetectionScheduler:
+    """
+    Decides per frame whether YOLO should run.
+
+    - never faster than max_fps, and never more than cpu_budget of one core (from measured latency)
+    - immediately (within those limits) while worker eyes are missing or boxes are moving
+    - at least min_fps while the scene is stable
+    """
+
+    RATE_WINDOW = 5.0
+
+    def __init__(self, max_fps=15.0, min_fps=3.0, cpu_budget=0.5, stable_iou=0.8):
+        self.configure(max_fps, min_fps, cpu_budget, stable_iou)
+        self.last_run = None
+        self.latency_ema = 0.0
+        self.stable = False
+        self.prev_boxes = []
+        self.run_times = deque()
+        self.decisions = {}
+        self.last_reason = None
+
+    def configure(self, max_fps, min_fps, cpu_budget, stable_iou):
+        self.max_fps = max(0.1, float(max_fps))
+        self.min_fps = min(self.max_fps, max(0.1, float(min_fps)))
+        self.cpu_budget = min(1.0, max(0.05, float(cpu_budget)))
+        self.stable_iou = float(stable_iou)
+
+    def min_interval(self):
+        return max(1.0 / self.max_fps, self.latency_ema / self.cpu_budget)
+
+    def should_detect(self, now, eyes_missing):
+        if self.last_run is None:
+            reason = "initial"
+        else:
+            elapsed = now - self.last_run
+            if elapsed < self.min_interval():
+                reason = "throttled"
+            elif eyes_missing:
+                reason = "reacquire"
+            elif not self.stable:
+                reason = "motion"
+            elif elapsed >= 1.0 / self.min_fps:
+                reason = "refresh"
+            else:
+                reason = "stable"
+
+        self.decisions[reason] = self.decisions.get(reason, 0) + 1
+        self.last_reason = reason
+        return reason not in ("throttled", "stable")
+
+    def record(self, boxes, latency, now):
+        """Feed back the worker-eye boxes and latency of a detector run started at `now`."""
+        self.last_run = now
+        self.latency_ema = latency if self.latency_ema == 0.0 else 0.8 * self.latency_ema + 0.2 * latency
+        self.stable = len(boxes) > 0 and len(boxes) == len(self.prev_boxes) and all(
+            box_iou(a, b) >= self.stable_iou for a, b in zip(boxes, self.prev_boxes)
+        )
+        self.prev_boxes = [tuple(map(int, b)) for b in boxes]
+
+        self.run_times.append(now)
+        while self.run_times and now - self.run_times[0] > self.RATE_WINDOW:
+            self.run_times.popleft()
+
+    def note_motion(self):
+        """Called when tracking sees the boxes move or lose lock, so the next frame re-detects sooner."""
+        self.stable = False
+
+    def detector_fps(self, now=None):
+        now = time.monotonic() if now is None else now
+        recent = [t for t in list(self.run_times) if now - t <= self.RATE_WINDOW]
+        return len(recent) / self.RATE_WINDOW
+
+    def stats(self, now=None):
+        return {
+            "detector_fps": round(self.detector_fps(now), 2),
+            "latency_ms": round(self.latency_ema * 1000, 2),
+            "min_interval_ms": round(self.min_interval() * 1000, 2),
+            "stable": self.stable,
+            "last_reason": self.last_reason,
+            "decisions": dict(self.decisions),
+        }
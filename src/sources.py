@@ -0,0 +1,367 @@
+import os
+import glob
+import time
+import cv2
+import numpy as np
+
+from src.capture import CapturedFrame
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource:
+    """
+    Where the pipeline's frames come from. read() returns the next CapturedFrame, or None when a
+    read failed or the input ran out; `finished` is set once a non-looping source has nothing
+    left. Every frame carries `source_time`, its position in the source in seconds (increasing
+    across loops). Paced sources sleep so frames come out at that rate, like a live camera.
+    """
+
+    kind = "source"
+
+    def __init__(self, fps=15.0, loop=True, pace=True):
+        self.fps = float(fps) if fps else 15.0
+        self.loop = loop
+        self.pace = pace
+        self.finished = False
+        self.frames_read = 0
+        self.loops = 0
+        # (monotonic time, source_time) the pacing clock is anchored at
+        self._clock = None
+
+    def open(self):
+        return True
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+    def read(self):
+        raise NotImplementedError
+
+    def _deliver(self, source_time, jpeg=None, image=None):
+        if self.pace:
+            self._wait_until(source_time)
+        self.frames_read += 1
+        return CapturedFrame(jpeg=jpeg, image=image, source_time=source_time)
+
+    def _wait_until(self, source_time):
+        now = time.monotonic()
+        if self._clock is None:
+            self._clock = (now, source_time)
+            return
+        start, origin = self._clock
+        delay = start + (source_time - origin) - now
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1.0:
+            # Consumer stalled (or the source jumped); resync instead of bursting to catch up
+            self._clock = (now, source_time)
+
+    def stats(self):
+        return {
+            "type": self.kind,
+            "fps": round(self.fps, 2),
+            "loop": self.loop,
+            "pace": self.pace,
+            "frames_read": self.frames_read,
+            "loops": self.loops,
+            "finished": self.finished,
+        }
+
+
+class V4L2Source(FrameSource):
+    """
+    A UVC camera. With MJPG and passthrough the camera's JPEG buffers are handed on undecoded;
+    if the first one can't be decoded on its own, passthrough is switched off and the camera reopened.
+    """
+
+    kind = "v4l2"
+
+    def __init__(self, index=0, width=1280, height=720, fourcc="MJPG", buffer_size=1, fps=None, passthrough=True):
+        super().__init__(fps=fps, loop=False, pace=False)
+        self.index = index
+        self.width = width
+        self.height = height
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+        self.requested_fps = fps
+        self.passthrough = passthrough and str(fourcc).upper() == "MJPG"
+        self.passthrough_checked = False
+        self.cap = None
+        # Offset mapping driver timestamps onto time.monotonic(); None once the driver stops reporting them
+        self.driver_offset = None
+        self.driver_clock = True
+
+    def open(self):
+        self.driver_offset = None
+        self.driver_clock = True
+        cap = cv2.VideoCapture(self.index, cv2.CAP_V4L2)
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        if self.requested_fps:
+            cap.set(cv2.CAP_PROP_FPS, self.requested_fps)
+        if self.passthrough:
+            # Hand back the MJPEG buffer instead of a decoded BGR frame
+            cap.set(cv2.CAP_PROP_FORMAT, -1)
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        self.cap = cap
+        return cap.isOpened()
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+    def read(self):
+        """Works whether or not the backend honoured passthrough."""
+        if not self.isOpened():
+            return None
+        ret, raw = self.cap.read()
+        if not ret or raw is None or raw.size == 0:
+            return None
+        source_time = self._timestamp()
+        if raw.ndim == 3:
+            return self._deliver(source_time, image=raw)
+
+        data = raw.tobytes()
+        if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+            return None
+        frame = self._deliver(source_time, jpeg=data)
+        if not self.passthrough_checked:
+            # Some UVC cameras send JPEGs libjpeg can't decode on its own; let OpenCV decode those
+            if frame.image is None:
+                self.passthrough = False
+                self.release()
+                self.open()
+                return None
+            self.passthrough_checked = True
+        return frame
+
+    def _timestamp(self):
+        """
+        Driver buffer timestamp, shifted onto the monotonic clock. The first frame fixes the offset; if the
+        driver ever reports 0 the source stays on time.monotonic() so source_time never jumps between clocks.
+        """
+        now = time.monotonic()
+        if not self.driver_clock:
+            return now
+        driver_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if driver_time <= 0:
+            self.driver_clock = False
+            return now
+        if self.driver_offset is None:
+            self.driver_offset = now - driver_time
+        return driver_time + self.driver_offset
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"fps": self.requested_fps, "index": self.index, "size": [self.width, self.height],
+                      "fourcc": self.fourcc, "passthrough": self.passthrough,
+                      "clock": "driver" if self.driver_clock and self.driver_offset is not None else "monotonic"})
+        return stats
+
+
+class VideoFileSource(FrameSource):
+    """A recorded video (e.g. an evidence clip), timed by its own timestamps."""
+
+    kind = "file"
+
+    def __init__(self, path, fps=None, loop=True, pace=True):
+        super().__init__(fps=fps, loop=loop, pace=pace)
+        self.path = path
+        self.fps_override = fps
+        self.cap = None
+        self.index = 0
+        self.loop_offset = 0.0
+        self.last_time = 0.0
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            return False
+        if not self.fps_override:
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or self.fps
+        return True
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+    def read(self):
+        if not self.isOpened() or self.finished:
+            return None
+        ret, image = self.cap.read()
+        if not ret:
+            if not self.loop:
+                self.finished = True
+                return None
+            self.loops += 1
+            self.loop_offset = self.last_time + 1.0 / self.fps
+            self.index = 0
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, image = self.cap.read()
+            if not ret:
+                return None
+
+        if self.fps_override:
+            position = self.index / self.fps
+        else:
+            position = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 or self.index / self.fps
+        self.index += 1
+        self.last_time = self.loop_offset + position
+        return self._deliver(self.last_time, image=image)
+
+    def stats(self):
+        stats = super().stats()
+        stats["path"] = self.path
+        return stats
+
+
+class ImageDirSource(FrameSource):
+    """
+    A directory of still images played as a video at `fps`. JPEG files are passed on as bytes
+    when passthrough is on, the same way camera MJPEG is.
+    """
+
+    kind = "imagedir"
+
+    def __init__(self, path, fps=15.0, loop=True, pace=True, passthrough=True):
+        super().__init__(fps=fps, loop=loop, pace=pace)
+        self.path = path
+        self.passthrough = passthrough
+        self.files = []
+        self.index = 0
+
+    def open(self):
+        self.files = sorted(p for p in glob.glob(os.path.join(self.path, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+        return bool(self.files)
+
+    def isOpened(self):
+        return bool(self.files)
+
+    def read(self):
+        if not self.files or self.finished:
+            return None
+        if self.index >= len(self.files):
+            if not self.loop:
+                self.finished = True
+                return None
+            if self.index % len(self.files) == 0:
+                self.loops += 1
+        path = self.files[self.index % len(self.files)]
+        source_time = self.index / self.fps
+        self.index += 1
+
+        if self.passthrough and path.lower().endswith((".jpg", ".jpeg")):
+            with open(path, "rb") as f:
+                data = f.read()
+            if data[:2] == b"\xff\xd8":
+                return self._deliver(source_time, jpeg=data)
+        image = cv2.imread(path)
+        if image is None:
+            return None
+        return self._deliver(source_time, image=image)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"path": self.path, "images": len(self.files)})
+        return stats
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generated frames for load testing without a camera: colour bars with a moving box, or noise.
+    With passthrough each frame is handed on as a JPEG, like camera MJPEG.
+    """
+
+    kind = "synthetic"
+    PATTERNS = ("bars", "noise")
+
+    def __init__(self, width=1280, height=720, fps=15.0, pattern="bars", pace=True, passthrough=True, jpeg_quality=85):
+        super().__init__(fps=fps, loop=True, pace=pace)
+        self.width = width
+        self.height = height
+        self.pattern = pattern if pattern in self.PATTERNS else "bars"
+        self.passthrough = passthrough
+        self.jpeg_quality = jpeg_quality
+        self.index = 0
+        self.rng = np.random.default_rng(0)
+        self.background = None
+
+    def open(self):
+        colors = np.array([[255, 255, 255], [0, 255, 255], [255, 255, 0], [0, 255, 0],
+                           [255, 0, 255], [0, 0, 255], [255, 0, 0], [0, 0, 0]], dtype=np.uint8)
+        bars = np.repeat(colors, -(-self.width // len(colors)), axis=0)[:self.width]
+        self.background = np.ascontiguousarray(np.broadcast_to(bars, (self.height, self.width, 3)))
+        return True
+
+    def read(self):
+        if self.background is None:
+            self.open()
+        if self.pattern == "noise":
+            image = self.rng.integers(0, 256, (self.height, self.width, 3), dtype=np.uint8)
+        else:
+            image = self.background.copy()
+            size = max(16, min(self.width, self.height) // 4)
+            span_x, span_y = max(1, self.width - size), max(1, self.height - size)
+            x = (self.index * 7) % (2 * span_x)
+            y = (self.index * 5) % (2 * span_y)
+            x, y = min(x, 2 * span_x - x), min(y, 2 * span_y - y)
+            cv2.rectangle(image, (x, y), (x + size, y + size), (128, 128, 128), -1)
+        source_time = self.index / self.fps
+        self.index += 1
+
+        if self.passthrough:
+            ok, encoded = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if ok:
+                return self._deliver(source_time, jpeg=encoded.tobytes())
+        return self._deliver(source_time, image=image)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"size": [self.width, self.height], "pattern": self.pattern})
+        return stats
+
+
+SOURCE_TYPES = ("v4l2", "file", "imagedir", "synthetic")
+
+
+def make_source(config):
+    """Build the frame source selected by `source_type` from a config mapping."""
+    kind = config.get("source_type", "v4l2")
+    path = config.get("source_path", "")
+    fps = config.get("source_fps")
+    loop = bool(config.get("source_loop", True))
+    pace = bool(config.get("source_pace", True))
+    passthrough = bool(config.get("camera_passthrough", True))
+    width = int(config.get("camera_width", 1280))
+    height = int(config.get("camera_height", 720))
+
+    if kind == "file":
+        return VideoFileSource(path, fps=fps, loop=loop, pace=pace)
+    if kind == "imagedir":
+        return ImageDirSource(path, fps=fps or 15.0, loop=loop, pace=pace, passthrough=passthrough)
+    if kind == "synthetic":
+        return SyntheticSource(width, height, fps=fps or 15.0, pattern=config.get("source_pattern", "bars"),
+                               pace=pace, passthrough=passthrough)
+    if kind != "v4l2":
+        raise ValueError(f"Unknown source_type {kind!r}, expected one of {', '.join(SOURCE_TYPES)}")
+    return V4L2Source(
+        index=config.get("camera_index", 0),
+        width=width,
+        height=height,
+        fourcc=str(config.get("camera_fourcc", "MJPG")),
+        buffer_size=int(config.get("camera_buffer_size", 1)),
+        fps=fps,
+        passthrough=passthrough,
+    )
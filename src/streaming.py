@@ -1,27 +1,98 @@
+import asyncio
 import cv2
 import numpy as np
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
 import global_state as state
 
-def gen_frames():
-    empty_frame = np.zeros((state.CAM_HEIGHT, state.CAM_WIDTH, 3), dtype=np.uint8)
+# A client that hasn't acknowledged a frame for this long is treated as gone
+WS_ACK_TIMEOUT = 10.0
+
+def camera_hubs(camera_id=None):
+    """(frame hub, metadata hub) of one camera; the first camera's for None. None if there's no such camera."""
+    if camera_id is None:
+        return state.frame_hub, state.meta_hub
+    if camera_id not in state.frame_hubs:
+        return None
+    return state.frame_hubs[camera_id], state.meta_hubs[camera_id]
+
+def gen_frames(max_fps=None, variant=None, hub=None):
+    hub = hub or state.frame_hub
+    variant = variant or hub.DEFAULT_VARIANT
+    empty_frame = np.zeros((state.config_mgr.get("camera_height", 720), state.config_mgr.get("camera_width", 1280), 3), dtype=np.uint8)
     _, encoded_empty = cv2.imencode('.jpg', empty_frame)
     backup_frame = encoded_empty.tobytes()
 
-    while True:
-        if state.new_frame_event.wait(timeout=1.0):
-            with state.frame_lock:
-                if state.latest_jpeg_frame:
-                    data = state.latest_jpeg_frame
-                    backup_frame = state.latest_jpeg_frame 
-                else:
-                    data = backup_frame
-            state.new_frame_event.clear()
-        else:
-            data = backup_frame
-
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + data + b'\r\n')
-
-def get_video_feed_response():
-    return StreamingResponse(gen_frames(), media_type="multipart/x-mixed-replace; boundary=frame")
\ No newline at end of file
+    async def parts():
+        async for data in hub.frames(max_fps=max_fps, variant=variant):
+            if data is None:
+                data = backup_frame
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + data + b'\r\n')
+
+    return parts()
+
+def get_video_feed_response(max_fps=None, scale=None, quality=None, camera_id=None):
+    hubs = camera_hubs(camera_id)
+    if hubs is None:
+        raise HTTPException(status_code=404, detail=f"Unknown camera {camera_id}")
+    if max_fps is not None and max_fps <= 0:
+        max_fps = None
+    variant = hubs[0].variant_key(scale, quality)
+    return StreamingResponse(gen_frames(max_fps, variant, hubs[0]), media_type="multipart/x-mixed-replace; boundary=frame")
+
+
+async def stream_websocket(websocket: WebSocket, max_fps=None, scale=None, quality=None, camera_id=None):
+    """
+    Binary JPEG frames over a WebSocket. The next frame goes out only after the client acks the
+    previous one, so a slow client gets fewer, fresher frames instead of a growing backlog.
+    """
+    hubs = camera_hubs(camera_id)
+    if hubs is None:
+        await websocket.close(code=1008)
+        return
+    if max_fps is not None and max_fps <= 0:
+        max_fps = None
+    variant = hubs[0].variant_key(scale, quality)
+    await websocket.accept()
+    frames = hubs[0].frames(max_fps=max_fps, variant=variant)
+    try:
+        async for data in frames:
+            if data is None:
+                continue
+            # send_bytes returns once the frame is handed to the transport (drained); the ack confirms it was shown
+            await websocket.send_bytes(data)
+            await asyncio.wait_for(websocket.receive_text(), timeout=WS_ACK_TIMEOUT)
+    except (WebSocketDisconnect, asyncio.TimeoutError, RuntimeError):
+        pass
+    finally:
+        await frames.aclose()
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
+
+
+async def stream_metadata_websocket(websocket: WebSocket, max_fps=None, camera_id=None):
+    """Latest detection metadata as compact JSON text messages; a slow client skips to the newest."""
+    hubs = camera_hubs(camera_id)
+    if hubs is None:
+        await websocket.close(code=1008)
+        return
+    if max_fps is not None and max_fps <= 0:
+        max_fps = None
+    await websocket.accept()
+    messages = hubs[1].frames(max_fps=max_fps)
+    try:
+        async for data in messages:
+            if data is None:
+                continue
+            await websocket.send_text(data.decode())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        await messages.aclose()
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
@@ -1,11 +1,70 @@
+import cv2
 import numpy as np
 import time
 
 class EyeTracker:
-    def __init__(self, drowsy_threshold=2.0):
+    def __init__(self, drowsy_threshold=2.0, search_margin=0.5, min_score=0.6):
         self.eye_timers = {} 
         self.drowsy_threshold = drowsy_threshold
 
+        # Box tracking between detector runs
+        self.search_margin = search_margin
+        self.min_score = min_score
+        self.templates = []
+        self.tracked_boxes = []
+        self.last_motion = 0.0
+        self.lost_count = 0
+
+    def sync(self, frame, boxes):
+        """Re-anchor tracking on fresh detector boxes: keep a gray template of each box."""
+        h, w = frame.shape[:2]
+        self.templates, self.tracked_boxes = [], []
+        self.last_motion, self.lost_count = 0.0, 0
+        for box in boxes:
+            x1, y1, x2, y2 = map(int, box)
+            x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+            if x2 - x1 < 4 or y2 - y1 < 4:
+                self.templates.append(None)
+            else:
+                self.templates.append(cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY))
+            self.tracked_boxes.append([x1, y1, x2, y2])
+
+    def clear(self):
+        """Drop all templates (the detector found nothing to follow)."""
+        self.templates, self.tracked_boxes = [], []
+        self.last_motion, self.lost_count = 0.0, 0
+
+    def track(self, frame):
+        """
+        Move every synced box to where its template matches best inside a small window around it.
+        Boxes whose match score is below min_score stay where they were.
+        """
+        h, w = frame.shape[:2]
+        self.last_motion, self.lost_count = 0.0, 0
+        for i, template in enumerate(self.templates):
+            x1, y1, x2, y2 = self.tracked_boxes[i]
+            if template is None:
+                continue
+            th, tw = template.shape
+            mx, my = int(tw * self.search_margin) + 1, int(th * self.search_margin) + 1
+            sx1, sy1 = max(0, x1 - mx), max(0, y1 - my)
+            sx2, sy2 = min(w, x1 + tw + mx), min(h, y1 + th + my)
+            if sx2 - sx1 < tw or sy2 - sy1 < th:
+                self.lost_count += 1
+                continue
+
+            search = cv2.cvtColor(frame[sy1:sy2, sx1:sx2], cv2.COLOR_BGR2GRAY)
+            scores = cv2.matchTemplate(search, template, cv2.TM_CCOEFF_NORMED)
+            _, best_score, _, (bx, by) = cv2.minMaxLoc(scores)
+            if best_score < self.min_score:
+                self.lost_count += 1
+                continue
+
+            nx1, ny1 = sx1 + bx, sy1 + by
+            self.last_motion = max(self.last_motion, abs(nx1 - x1) / tw, abs(ny1 - y1) / th)
+            self.tracked_boxes[i] = [nx1, ny1, nx1 + (x2 - x1), ny1 + (y2 - y1)]
+        return [list(b) for b in self.tracked_boxes]
+
     def filter_worker_eyes(self, all_boxes, frame_shape, mode=0):
         frame_h, frame_w = frame_shape[:2]
         frame_center = (frame_w // 2, frame_h // 2)
@@ -61,9 +120,9 @@ class EyeTracker:
 
         return center_eyes, out_of_center
 
-    def update_drowsiness(self, eye_index, state_label):
+    def update_drowsiness(self, eye_index, state_label, now=None):
         key = eye_index 
-        current_time = time.time()
+        current_time = time.monotonic() if now is None else now
         is_drowsy = False
 
         if state_label == 0:  
@@ -4,6 +4,7 @@ import subprocess
 import re
 import socket
 import os
+import time
 import glob
 import requests
 import asyncio
@@ -13,6 +14,7 @@ from yaml import Loader
 from pathlib import Path
 
 import global_state as state
+from src.metrics import sync_files_total, sync_bytes_total, sync_seconds_total
 
 logger = logging.getLogger("utils")
 
@@ -25,7 +27,8 @@ async def perform_safe_reboot():
             cam=state.global_cam_ref, 
             led_pin=state.global_led_pin, 
             gpio_enabled=state.global_gpio_enabled, 
-            logger=logger
+            logger=logger,
+            led_pins=state.global_led_pins
         )
         logger.info("Resources released successfully.")
     except Exception as e:
@@ -173,7 +176,7 @@ def get_log_data(limit=60):
 try:
     import RPi.GPIO as GPIO
     RPI_AVAILABLE = True
-except RuntimeError:
+except (RuntimeError, ImportError):
     GPIO = None
     RPI_AVAILABLE = False
 
@@ -199,8 +202,8 @@ def set_relay(gpio_enabled, led_pin, logger, state):
     except Exception as e:
         logger.error(f"GPIO blink error: {e}")
   
-def cleanup_resources(cam, led_pin, gpio_enabled, logger):
-    """Cleanup all resources safely"""
+def cleanup_resources(cam, led_pin, gpio_enabled, logger, led_pins=()):
+    """Cleanup all resources safely. led_pins: relay pins of the other cameras, also switched off."""
     logger.info("Cleaning up resources...")
     try:
         if cam and cam.isOpened(): cam.release()
@@ -211,7 +214,8 @@ def cleanup_resources(cam, led_pin, gpio_enabled, logger):
     
     if gpio_enabled and RPI_AVAILABLE:
         try:
-            GPIO.output(led_pin, GPIO.LOW)
+            for pin in dict.fromkeys([led_pin, *led_pins]):
+                GPIO.output(pin, GPIO.LOW)
             GPIO.cleanup()
             logger.info("GPIO cleaned up")
         except: pass
@@ -252,6 +256,7 @@ def perform_sync(server_ip, logger):
     total_files = 0
     success_count = 0
     fail_count = 0
+    sync_start = time.monotonic()
 
     try:
         try: requests.get(base_url, timeout=3)
@@ -266,6 +271,7 @@ def perform_sync(server_ip, logger):
             for file_path in files:
                 filename = os.path.basename(file_path)
                 try:
+                    size = os.path.getsize(file_path)
                     with open(file_path, 'rb') as f:
                         files_payload = {'file': (filename, f, 'image/jpeg')}
                         data_payload = {'sub_folder': remote_subfolder}
@@ -276,6 +282,7 @@ def perform_sync(server_ip, logger):
                             f.close()
                             os.remove(file_path)
                             success_count += 1
+                            sync_bytes_total.inc(size)
                             print(f"Synced & Deleted: {filename}")
                         else:
                             fail_count += 1
@@ -284,6 +291,9 @@ def perform_sync(server_ip, logger):
                     fail_count += 1
                     logger.error(f"Error syncing {filename}: {str(e)}")
                     
+        sync_files_total.labels("ok").inc(success_count)
+        sync_files_total.labels("failed").inc(fail_count)
+        sync_seconds_total.inc(time.monotonic() - sync_start)
         result_msg = f"Sync Complete: Sent {success_count}/{total_files} files."
         if fail_count > 0:
             result_msg += f" ({fail_count} failed)"
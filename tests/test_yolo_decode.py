@@ -0,0 +1,105 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.models import YOLOModel
+
+FRAME_HW = (720, 1280)
+SCALE = 224 / 1280
+PAD = (0, (224 - int(720 * SCALE)) // 2)
+
+
+def legacy_decode(output, scale, pad, frame_hw, conf_thres, iou_thres):
+    """The per-row loop + cv2.dnn.NMSBoxes that YOLOModel.detect used before decode() existed."""
+    pad_w, pad_h = pad
+    boxes_temp, scores_temp = [], []
+    for row in output.transpose():
+        max_score = np.amax(row[4:])
+        if max_score >= conf_thres:
+            cx, cy, w, h = row[:4]
+            boxes_temp.append([int(cx - w / 2), int(cy - h / 2), int(w), int(h)])
+            scores_temp.append(float(max_score))
+    indices = cv2.dnn.NMSBoxes(boxes_temp, scores_temp, conf_thres, iou_thres)
+    final_boxes = []
+    frame_h, frame_w = frame_hw
+    for i in np.array(indices).flatten():
+        bx, by, bw, bh = boxes_temp[i]
+        x1 = max(0, int((bx - pad_w) / scale))
+        y1 = max(0, int((by - pad_h) / scale))
+        final_boxes.append([x1, y1, min(frame_w, x1 + int(bw / scale)), min(frame_h, y1 + int(bh / scale))])
+    return np.array(final_boxes, dtype=np.int32).reshape(-1, 4)
+
+
+def make_model(conf_thres, iou_thres):
+    # decode() only needs the thresholds; skip loading an ONNX session
+    model = YOLOModel.__new__(YOLOModel)
+    model.conf_thres = conf_thres
+    model.iou_thres = iou_thres
+    return model
+
+
+def random_output(rng, ties=False):
+    """Boxes clustered around a few centres so NMS has real overlaps to resolve."""
+    n, num_classes = rng.integers(50, 3000), rng.integers(1, 3)
+    output = np.zeros((4 + num_classes, n), dtype=np.float32)
+    centres = rng.uniform(0, 224, (8, 2))
+    cluster = rng.integers(0, 8, n)
+    output[0] = centres[cluster, 0] + rng.normal(0, 4, n)
+    output[1] = centres[cluster, 1] + rng.normal(0, 4, n)
+    output[2] = rng.uniform(5, 60, n)
+    output[3] = rng.uniform(5, 40, n)
+    output[4:] = rng.uniform(0, 1, (num_classes, n)) ** 3
+    if ties:
+        output[4:] = np.round(output[4:], 2)
+    return output
+
+
+@pytest.mark.parametrize("seed", range(500))
+def test_decode_matches_legacy(seed):
+    rng = np.random.default_rng(seed)
+    conf_thres = float(rng.choice([0.25, 0.3, 0.5]))
+    iou_thres = float(rng.choice([0.35, 0.5]))
+    output = random_output(rng, ties=seed % 5 == 0)
+
+    expected = legacy_decode(output, SCALE, PAD, FRAME_HW, conf_thres, iou_thres)
+    actual = make_model(conf_thres, iou_thres).decode(output, SCALE, PAD, FRAME_HW)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_decode_score_equal_to_threshold_is_dropped():
+    output = np.array([[100, 100], [100, 150], [20, 20], [20, 20], [0.3, 0.31]], dtype=np.float32)
+    expected = legacy_decode(output, SCALE, PAD, FRAME_HW, 0.3, 0.35)
+    actual = make_model(0.3, 0.35).decode(output, SCALE, PAD, FRAME_HW)
+    assert len(actual) == 1
+    np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("width,shift", [(27, s) for s in range(11, 16)] + [(30, s) for s in range(8, 13)])
+def test_decode_borderline_iou(width, shift):
+    # Two boxes sliding apart: IoU is exactly 0.35 at (27, 13) and exactly 0.5 at (30, 10)
+    output = np.array([[100, 100 + shift], [100, 100], [width, width], [width, width], [0.9, 0.8]], dtype=np.float32)
+    for iou_thres in (0.35, 0.5):
+        expected = legacy_decode(output, SCALE, PAD, FRAME_HW, 0.3, iou_thres)
+        actual = make_model(0.3, iou_thres).decode(output, SCALE, PAD, FRAME_HW)
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_decode_per_call_thresholds_override_model():
+    # Shared-detector cameras pass their own thresholds instead of the model's
+    output = np.array([[100, 113], [100, 100], [27, 27], [27, 27], [0.9, 0.8]], dtype=np.float32)
+    model = make_model(0.95, 0.9)
+    for iou_thres in (0.3, 0.5):
+        expected = legacy_decode(output, SCALE, PAD, FRAME_HW, 0.3, iou_thres)
+        np.testing.assert_array_equal(model.decode(output, SCALE, PAD, FRAME_HW, 0.3, iou_thres), expected)
+
+
+def test_decode_equal_scores_keep_first():
+    output = np.array([[100, 102, 160], [100, 100, 100], [20, 20, 20], [20, 20, 20], [0.7, 0.7, 0.7]], dtype=np.float32)
+    expected = legacy_decode(output, SCALE, PAD, FRAME_HW, 0.3, 0.35)
+    actual = make_model(0.3, 0.35).decode(output, SCALE, PAD, FRAME_HW)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_decode_nothing_above_threshold():
+    output = np.zeros((5, 10), dtype=np.float32)
+    assert make_model(0.3, 0.35).decode(output, SCALE, PAD, FRAME_HW).shape == (0, 4)